@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Start-up time and command latency.
+
+Measures, in fresh processes, how long it takes to import the client
+and find the command to run; *cold* with no entry point index (as
+after installing or upgrading something) and *warm* with one.  Then
+runs `ps`, `releases`, `routes`, `env` and `scale` in-process against
+the fakes in `fakes.py`, with the configured latency and collection
+sizes.
+
+Everything runs with `HOME` pointing at a scratch directory, so the
+user's configuration and caches are not touched.  gilliam-cli must be
+installed (`pip install -e .`) for its commands to be found.
+
+    $ python benchmarks/bench_cli.py --output before.json
+    ... change things ...
+    $ python benchmarks/bench_cli.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+COMMANDS = {
+    'ps': ['ps'],
+    'releases': ['releases'],
+    'routes': ['routes'],
+    'env': ['env'],
+    'scale': ['scale', 'svc0=3'],
+}
+
+# Run in a fresh process: import the client and load the command class.
+_STARTUP = """
+import time
+t0 = time.time()
+from gilliam_cli import script
+from gilliam_cli.plugins import CommandManager
+CommandManager('gilliam.commands').find_command([%r])
+print time.time() - t0
+"""
+
+
+def _stats(samples):
+    samples = sorted(samples)
+    return {'min': samples[0], 'median': samples[len(samples) // 2],
+            'max': samples[-1], 'samples': len(samples)}
+
+
+def _startup(home, command, cold):
+    env = dict(os.environ, HOME=home, PYTHONPATH=_ROOT)
+    if cold:
+        index = os.path.join(home, '.gilliam', 'cache', 'entry_points.json')
+        if os.path.exists(index):
+            os.unlink(index)
+    t0 = time.time()
+    output = subprocess.check_output(
+        [sys.executable, '-c', _STARTUP % (command,)], env=env)
+    return time.time() - t0, float(output)
+
+
+def bench_startup(home, repeat, command='routes'):
+    results = {}
+    for name, cold in (('cold', True), ('warm', False)):
+        _startup(home, command, cold)
+        process, imports = zip(*[_startup(home, command, cold)
+                                 for _ in range(repeat)])
+        results[name] = {'process': _stats(process),
+                         'import': _stats(imports)}
+    return results
+
+
+def _make_app(stage):
+    from gilliam_cli.plugins import CommandManager, ExtensionManager
+    from gilliam_cli.script import GilliamApp
+
+    class BenchApp(GilliamApp):
+
+        def initialize_app(self, argv):
+            GilliamApp.initialize_app(self, argv)
+            self.config.scheduler = lambda *a, **kw: stage.scheduler
+            self.config.router = lambda *a, **kw: stage.router
+            self.config._stage_resources()['service_registry'] = (
+                stage.registry)
+
+    devnull = open(os.devnull, 'w')
+    commands = CommandManager('gilliam.commands')
+    services = ExtensionManager('gilliam.services')
+    return lambda: BenchApp(commands, services, stdout=devnull,
+                            stderr=devnull)
+
+
+def bench_commands(stage, repeat, names):
+    make_app = _make_app(stage)
+    results = {}
+    for name in names:
+        argv = ['-F', 'bench'] + COMMANDS[name]
+        samples = []
+        for n in range(repeat + 1):
+            t0 = time.time()
+            status = make_app().run(argv)
+            samples.append(time.time() - t0)
+            if status:
+                sys.exit("{0}: exited with {1}".format(name, status))
+        results[name] = _stats(samples[1:])
+    return results
+
+
+def _statistics(results, path=()):
+    """Yield `(name, stats)` for every set of statistics in
+    `results`.
+    """
+    for key in sorted(results):
+        value = results[key]
+        if isinstance(value, dict) and 'median' in value:
+            yield '.'.join(path + (key,)), value
+        elif isinstance(value, dict):
+            for row in _statistics(value, path + (key,)):
+                yield row
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=_ROOT,
+            stderr=open(os.devnull, 'w')).strip()
+    except (EnvironmentError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help="seconds per request to the fake platform")
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--instances', type=int, default=200)
+    parser.add_argument('--releases', type=int, default=20)
+    parser.add_argument('--routes', type=int, default=100)
+    parser.add_argument('--command', action='append', dest='commands',
+                        choices=sorted(COMMANDS),
+                        help="only run this command (repeatable)")
+    parser.add_argument('--output', metavar='FILE',
+                        help="write the results to FILE as JSON")
+    parser.add_argument('--compare', metavar='FILE',
+                        help="compare with results from an earlier run")
+    options = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix='gilliam-bench-')
+    saved_home = os.environ.get('HOME')
+    os.environ['HOME'] = home
+    os.environ['GILLIAM_SERVICE_REGISTRY'] = 'registry.bench:3222'
+    sys.path.insert(0, _ROOT)
+    try:
+        from fakes import Stage
+        stage = Stage(latency=options.latency, page_size=options.page_size,
+                      instances=options.instances, releases=options.releases,
+                      routes=options.routes)
+        results = {
+            'revision': _git_revision(),
+            'python': sys.version.split()[0],
+            'parameters': {'repeat': options.repeat,
+                           'latency': options.latency,
+                           'page_size': options.page_size,
+                           'instances': options.instances,
+                           'releases': options.releases,
+                           'routes': options.routes},
+            'startup': bench_startup(home, options.repeat),
+            'commands': bench_commands(stage, options.repeat,
+                                       options.commands or sorted(COMMANDS)),
+        }
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+        if saved_home is not None:
+            os.environ['HOME'] = saved_home
+
+    if options.output:
+        with open(options.output, 'w') as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+    if options.compare:
+        with open(options.compare) as fp:
+            old = dict(_statistics(json.load(fp)))
+        print '%-32s %10s %10s %8s' % ('median', 'before', 'after', 'change')
+        for name, stats in _statistics(results):
+            if name not in old:
+                continue
+            before, after = old[name]['median'], stats['median']
+            print '%-32s %8.1fms %8.1fms %+7.1f%%' % (
+                name, before * 1e3, after * 1e3,
+                (after - before) / before * 100 if before else 0)
+    else:
+        print '%-32s %10s %10s %10s' % ('', 'min', 'median', 'max')
+        for name, stats in _statistics(results):
+            print '%-32s %8.1fms %8.1fms %8.1fms' % (
+                name, stats['min'] * 1e3, stats['median'] * 1e3,
+                stats['max'] * 1e3)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Peak memory of traversing a large collection.
+
+Serves a single page with 50,000 instances (what `ps` would list)
+from an in-process fake HTTP client and compares loading the whole
+page with `response.json()` against incremental parsing.  Each mode
+runs in its own process, since peak RSS never goes down.
+
+    $ python benchmarks/bench_collection.py [--items N]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_cli import util
+
+
+def _instance(n):
+    return {'name': 'www.%022d' % (n,), 'formation': 'bench',
+            'service': 'www', 'release': str(n % 7),
+            'state': 'running', 'status': None, 'reason': None,
+            'assigned_to': 'executor-%d' % (n % 50,),
+            'image': 'registry.example.com/bench/www:0c5b4e35',
+            'command': 'python web.py --port 80',
+            'env': {'DEBUG': '0', 'WORKERS': '4'}, 'ports': [80]}
+
+
+def _body(count):
+    """Generate the page in chunks, like a socket would."""
+    yield '{"links": {}, "items": ['
+    for n in xrange(count):
+        yield (',' if n else '') + json.dumps(_instance(n))
+    yield ']}'
+
+
+class _Response(object):
+
+    def __init__(self, count):
+        self.count = count
+
+    def iter_content(self, chunk_size):
+        buf = []
+        size = 0
+        for data in _body(self.count):
+            buf.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                yield ''.join(buf)
+                buf, size = [], 0
+        yield ''.join(buf)
+
+    def json(self):
+        return json.loads(''.join(_body(self.count)))
+
+
+class _Client(object):
+
+    def __init__(self, count):
+        self.count = count
+
+    def get(self, url, stream=False):
+        return _Response(self.count)
+
+
+def _run(mode, count):
+    t0 = time.time()
+    n = 0
+    for item in util.traverse_collection(
+            _Client(count), 'http://scheduler.service/instances',
+            incremental=(mode == 'incremental')):
+        n += 1
+    elapsed = time.time() - t0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print json.dumps({'mode': mode, 'items': n, 'time': elapsed,
+                      'peak_rss_kb': rss})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--mode', choices=('json', 'incremental'))
+    options = parser.parse_args()
+
+    if options.mode:
+        _run(options.mode, options.items)
+        return
+
+    print '%-12s %8s %8s %12s' % ('mode', 'items', 'time', 'peak rss')
+    for mode in ('json', 'incremental'):
+        result = json.loads(subprocess.check_output(
+            [sys.executable, __file__, '--mode', mode,
+             '--items', str(options.items)]))
+        print '%-12s %8d %7.2fs %9d KB' % (
+            mode, result['items'], result['time'], result['peak_rss_kb'])
+
+
+if __name__ == '__main__':
+    main()
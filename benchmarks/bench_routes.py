@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Route matching throughput.
+
+Builds a table of 10,000 routes spread over 100 domains (and a share
+without a domain), then matches random URLs against it with
+`gilliam_cli.routing.RouteIndex` and, for comparison, by trying every
+route in order of preference.
+
+    $ python benchmarks/bench_routes.py [--routes N] [--lookups N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_cli.routing import RouteIndex
+
+
+def _table(count, domains):
+    routes = []
+    for n in range(count):
+        kind = n % 4
+        domain = ('app%d.example.com' % (n % domains,) if kind != 3
+                  else None)
+        if kind == 0:
+            path = '/api/v%d/items/{id}' % (n,)
+        elif kind == 1:
+            path = '/static/%d/{rest:.*?}' % (n,)
+        elif kind == 2:
+            domain = '{acct}.' + domain
+            path = '/u%d/{user}/profile' % (n,)
+        else:
+            path = '/legacy/%d/{rest:.*?}' % (n,)
+        routes.append({'name': 'route%06d' % (n,), 'domain': domain,
+                       'path': path, 'target': 'http://svc%d.service/' % (n,)})
+    return routes
+
+
+def _urls(routes, count, rng):
+    urls = []
+    for _ in range(count):
+        route = rng.choice(routes)
+        host, path = route['domain'] or 'www.example.com', route['path']
+        host = host.replace('{acct}', 'acme')
+        for var, value in (('{id}', '42'), ('{rest:.*?}', 'a/b.css'),
+                           ('{user}', 'jane')):
+            path = path.replace(var, value)
+        if rng.random() < 0.1:
+            path += '/miss'
+        urls.append((host, path))
+    return urls
+
+
+def _linear(index):
+    routes = sorted(index.routes, key=lambda route: route.priority)
+
+    def match(host, path):
+        for route in routes:
+            variables = route.match(host, path)
+            if variables is not None:
+                return route, variables
+    return match
+
+
+def _throughput(match, urls):
+    t0 = time.time()
+    for host, path in urls:
+        match(host, path)
+    return len(urls) / (time.time() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--routes', type=int, default=10000)
+    parser.add_argument('--domains', type=int, default=100)
+    parser.add_argument('--lookups', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    routes = _table(options.routes, options.domains)
+    t0 = time.time()
+    index = RouteIndex(routes)
+    print '%d routes, index built in %.1fms' % (
+        len(routes), (time.time() - t0) * 1e3)
+
+    urls = _urls(routes, options.lookups, rng)
+    linear = _linear(index)
+    for host, path in urls[:200]:
+        assert index.match(host, path) == linear(host, path)
+
+    print '%-10s %12.0f lookups/s' % (
+        'index', _throughput(index.match, urls))
+    linear_urls = urls[:max(1, options.lookups // 100)]
+    print '%-10s %12.0f lookups/s' % (
+        'linear', _throughput(linear, linear_urls))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput of piping input into `gilliam run`.
+
+Streams a generated SQL dump into a stand-in executor process (see
+`fakes.FakeProcess`) the way `run` did before, with 4 KB reads
+through the file object, and the way it does now, with large reads
+that run ahead of the sender, with and without compression.
+
+    $ python benchmarks/bench_run.py [--size MB] [--frame-cost SECS]
+          [--bandwidth MB/s]
+"""
+
+import argparse
+from functools import partial
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_cli.commands.run import (_BULK_READ_AHEAD, gzip_chunks,
+                                      read_bulk)
+from gilliam_cli.util import prefetch
+
+from fakes import FakeProcess
+
+
+def _dump(fp, size):
+    """Write `size` bytes of something that looks like a SQL dump."""
+    n = 0
+    while fp.tell() < size:
+        fp.write("INSERT INTO events VALUES (%d, 'user%d', "
+                 "'2013-10-%02d 12:00:00', 'page_view', '/p/%d');\n"
+                 % (n, n % 1000, n % 28 + 1, n % 5000))
+        n += 1
+
+
+def _old(fp):
+    return iter(partial(fp.read, 4096), '')
+
+
+def _bulk(fp):
+    return prefetch(read_bulk(fp.fileno()), _BULK_READ_AHEAD)
+
+
+def _bulk_gzip(fp):
+    return prefetch(gzip_chunks(read_bulk(fp.fileno())), _BULK_READ_AHEAD)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=256,
+                        help="megabytes of input")
+    parser.add_argument('--frame-cost', type=float, default=0.0001,
+                        help="seconds it takes to send a frame")
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help="MB/s of the simulated connection")
+    options = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(prefix='gilliam-bench-') as dump:
+        _dump(dump, options.size * 1000000)
+        dump.flush()
+        size = dump.tell()
+
+        print '%-12s %10s %8s %10s %12s' % (
+            'mode', 'sent', 'frames', 'time', 'input rate')
+        for name, reader in (('read(4096)', _old), ('bulk', _bulk),
+                             ('bulk+gzip', _bulk_gzip)):
+            process = FakeProcess(
+                options.frame_cost,
+                options.bandwidth * 1e6 if options.bandwidth else None)
+            with open(dump.name, 'rb') as fp:
+                t0 = time.time()
+                process.attach(reader(fp), None)
+                elapsed = time.time() - t0
+            print '%-12s %8.1fMB %8d %9.2fs %9.1fMB/s' % (
+                name, process.bytes / 1e6, process.frames, elapsed,
+                size / 1e6 / elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time to read a large `gilliam.yml`.
+
+Generates a manifest of about 5,000 lines and reads it with the
+pure-Python loader, the pure-Python safe loader, the C safe loader
+(if PyYAML was built with libyaml) and through the parsed-file cache
+of `gilliam_cli.yamlio.load_file`.
+
+    $ python benchmarks/bench_yaml.py [--lines N] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_cli import yamlio
+
+
+def _manifest(lines):
+    """Return a manifest of roughly `lines` lines."""
+    out = ['services:']
+    n = 0
+    while len(out) < lines:
+        out.extend([
+            '  svc%d:' % (n,),
+            '    image: registry.example.com/bench/svc%d:0c5b4e35' % (n,),
+            '    command: python -m svc%d --port 80 --workers 4' % (n,),
+            '    ports:',
+            '      - 80',
+            '      - 8080',
+            '    env:',
+            '      DEBUG: "0"',
+            '      WORKERS: "4"',
+            '      DATABASE_URL: postgres://db%d.service/svc%d' % (n % 8, n),
+            '      SECRET_KEY: "%032x"' % (n,),
+            '    requires: [rank=%d]' % (n % 3,),
+        ])
+        n += 1
+    return '\n'.join(out) + '\n'
+
+
+def _time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.time()
+        fn()
+        elapsed = time.time() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    options = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix='gilliam-bench-')
+    try:
+        path = os.path.join(tmpdir, 'gilliam.yml')
+        with open(path, 'w') as fp:
+            fp.write(_manifest(options.lines))
+        cache_dir = os.path.join(tmpdir, 'cache')
+
+        def _read(loader):
+            with open(path) as fp:
+                return yaml.load(fp, Loader=loader)
+
+        cases = [('yaml.Loader', lambda: _read(yaml.Loader)),
+                 ('yaml.SafeLoader', lambda: _read(yaml.SafeLoader))]
+        if hasattr(yaml, 'CSafeLoader'):
+            cases.append(('yaml.CSafeLoader', lambda: _read(yaml.CSafeLoader)))
+        else:
+            print 'PyYAML was built without libyaml; no C loader'
+        yamlio.load_file(path, cache_dir)
+        cases.append(('load_file (cached)',
+                      lambda: yamlio.load_file(path, cache_dir)))
+
+        print '%d lines' % (options.lines,)
+        for name, fn in cases:
+            print '%-20s %9.1fms' % (name, _time(fn, options.repeat) * 1e3)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process stand-ins for the platform, for benchmarks.
+
+The fakes implement the methods of the `gilliam` clients that the
+commands use.  Every call sleeps for `latency` seconds, and
+collections are served in pages of `page_size` items with the same
+latency per page, like the real services would.
+"""
+
+import time
+
+
+class Stage(object):
+    """A formation with `instances` instances over `services`
+    services, `releases` releases and a router with `routes` routes.
+    """
+
+    def __init__(self, latency=0.005, page_size=100, instances=200,
+                 releases=20, routes=100, services=4, executors=10):
+        self.latency = latency
+        self.page_size = page_size
+        self.service_names = ['svc%d' % (n,) for n in range(services)]
+        self.executor_names = ['executor-%d' % (n,) for n in range(executors)]
+        self.release_list = [self._release(n) for n in range(1, releases + 1)]
+        self.instance_list = [self._instance(n) for n in range(instances)]
+        self.route_list = [self._route(n) for n in range(routes)]
+        self.scheduler = FakeScheduler(self)
+        self.router = FakeRouter(self)
+        self.registry = FakeRegistry(self)
+
+    def _release(self, n):
+        return {'name': str(n), 'author': 'bench', 'message': 'release %d' % n,
+                'services': {name: {'image': 'bench/%s:%d' % (name, n),
+                                    'command': 'run %s' % (name,),
+                                    'env': {'DEBUG': '0', 'N': str(n)},
+                                    'ports': [80]}
+                             for name in self.service_names}}
+
+    def _instance(self, n):
+        service = self.service_names[n % len(self.service_names)]
+        release = self.release_list[-1 - (n % 2)]
+        return {'name': '%s.%08d' % (service, n), 'formation': 'bench',
+                'service': service, 'release': release['name'],
+                'state': 'running', 'status': None, 'reason': None,
+                'assigned_to': self.executor_names[
+                    n % len(self.executor_names)],
+                'image': release['services'][service]['image'],
+                'command': release['services'][service]['command']}
+
+    def _route(self, n):
+        return {'name': 'route%06d' % (n,), 'domain': None,
+                'path': '/r%d/{rest:.*?}' % (n,),
+                'target': 'http://svc%d.bench.service/{rest}' % (n % 4,)}
+
+    def call(self):
+        """Pay the latency of one request."""
+        if self.latency:
+            time.sleep(self.latency)
+
+    def paged(self, items):
+        """Yield `items`, paying the latency of one request per page."""
+        for n, item in enumerate(items):
+            if n % self.page_size == 0:
+                self.call()
+            yield item
+        if not items:
+            self.call()
+
+
+class FakeScheduler(object):
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def instances(self, formation, service=None, release=None,
+                  state=None, assigned_to=None):
+        filters = {'service': service, 'release': release, 'state': state,
+                   'assigned_to': assigned_to}
+        return self.stage.paged([
+            instance for instance in self.stage.instance_list
+            if all(value is None or instance[name] == value
+                   for (name, value) in filters.items())])
+
+    def releases(self, formation):
+        return self.stage.paged(self.stage.release_list)
+
+    def create_release(self, formation, name, author, message, services):
+        self.stage.call()
+        return {'name': name, 'author': author, 'message': message,
+                'services': services}
+
+    def scale(self, formation, release, scales):
+        self.stage.call()
+        return False
+
+    def migrate(self, formation, release):
+        self.stage.call()
+        return False
+
+
+class FakeRouter(object):
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def routes(self):
+        return self.stage.paged(self.stage.route_list)
+
+    def create(self, name, domain, path, target):
+        self.stage.call()
+        return {'name': name, 'domain': domain, 'path': path,
+                'target': target}
+
+    def delete(self, name):
+        self.stage.call()
+
+
+class FakeRegistry(object):
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def query_formation(self, formation):
+        self.stage.call()
+        if formation != 'executor':
+            return []
+        return [('executor.%s' % (name,),
+                 {'formation': 'executor', 'service': 'api',
+                  'instance': name, 'host': '127.0.0.1', 'ports': {}})
+                for name in self.stage.executor_names]
+
+
+class FakeProcess(object):
+    """A process on a stand-in executor.  `attach` consumes the input
+    as if it was sent over the websocket: every frame costs
+    `frame_cost` seconds, plus its size divided by `bandwidth` (in
+    bytes per second) if given.
+    """
+
+    def __init__(self, frame_cost=0.0001, bandwidth=None):
+        self.frame_cost = frame_cost
+        self.bandwidth = bandwidth
+        self.frames = 0
+        self.bytes = 0
+
+    def attach(self, reader, output, replay=False):
+        for chunk in reader:
+            self.frames += 1
+            self.bytes += len(chunk)
+            delay = self.frame_cost + (
+                len(chunk) / float(self.bandwidth) if self.bandwidth else 0)
+            if delay:
+                time.sleep(delay)
@@ -0,0 +1,336 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A resident process that runs commands on behalf of `bin/gilliam`.
+
+The agent listens on a per-user Unix socket.  It keeps the imported
+modules, the entry point index and, per stage, the HTTP session with
+its pooled connections, the service registry clients and the
+resolution caches.  A command sent to it therefore skips interpreter
+start-up and everything that the first request of a fresh process
+has to do.
+
+`forward` is used by `bin/gilliam`.  It only needs the standard
+library, so that it is cheap to import.  If no agent is running, or
+the agent is busy with another command, it returns `None` and the
+command is run in-process as usual.  So are commands that use the
+terminal, and commands that keep running until interrupted (such as
+`ps --watch`).
+
+Commands are run one at a time, with the agent's working directory,
+environment and standard streams switched to those of the client.
+
+Messages in both directions are frames: a type byte, the length of
+the payload as a 32-bit big-endian integer and the payload:
+
+- `A` (client): JSON object with `argv`, `cwd` and `env`.
+- `I` (client): data on stdin; an empty payload means end of file.
+- `K` (agent): the command has been accepted.
+- `O`, `E` (agent): data written to stdout and stderr.
+- `X` (agent): the exit status, in decimal.
+- `B` (agent): the agent is busy; run the command locally.
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+import struct
+import sys
+import threading
+
+
+SOCKET_PATH = os.path.expanduser(
+    os.getenv('GILLIAM_AGENT_SOCKET', '~/.gilliam/agent.sock'))
+
+# Commands that need the terminal, or are the agent itself.
+_LOCAL_COMMANDS = frozenset(['agent', 'auth', 'run'])
+
+# Options that keep a command running until it is interrupted.  The
+# agent cannot tell that such a command has lost its client while it
+# writes nothing, and it would keep every later command out.
+_WATCH_OPTIONS = ('--watch', '--follow')
+_WATCH_SHORT_OPTIONS = frozenset(['-w'])
+
+
+def _runs_locally(argv):
+    """Return true if the command `argv` should not be sent to the
+    agent.
+    """
+    if not argv or _LOCAL_COMMANDS.intersection(argv):
+        return True
+    for arg in argv:
+        if arg == '--':
+            break
+        # argparse accepts unambiguous prefixes of long options.
+        name = arg.split('=', 1)[0]
+        if arg in _WATCH_SHORT_OPTIONS or (
+                name.startswith('--') and len(name) > 2
+                and any(option.startswith(name) for option in _WATCH_OPTIONS)):
+            return True
+    return False
+
+_HEADER = struct.Struct('!cI')
+
+_CHUNK_SIZE = 64 * 1024
+
+
+def _send(sock, kind, payload=''):
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(sock, size):
+    data = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("connection closed")
+        data.append(chunk)
+        size -= len(chunk)
+    return ''.join(data)
+
+
+def _recv(sock):
+    kind, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return kind, _recv_exactly(sock, size) if size else ''
+
+
+def _pump_stdin(sock):
+    try:
+        if not os.isatty(0):
+            while True:
+                data = os.read(0, _CHUNK_SIZE)
+                if not data:
+                    break
+                _send(sock, 'I', data)
+        _send(sock, 'I')
+    except (EnvironmentError, socket.error):
+        pass
+
+
+def forward(argv, path=SOCKET_PATH):
+    """Run the command `argv` in the agent, relaying the standard
+    streams.
+
+    :returns: The exit status, or `None` if the command should be run
+        in-process.
+    """
+    if _runs_locally(argv) or os.getenv('GILLIAM_NO_AGENT'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        _send(sock, 'A', json.dumps({'argv': argv, 'cwd': os.getcwd(),
+                                     'env': dict(os.environ)}))
+        kind, payload = _recv(sock)
+    except (socket.error, EOFError):
+        sock.close()
+        return None
+    if kind != 'K':
+        sock.close()
+        return None
+
+    pump = threading.Thread(target=_pump_stdin, args=(sock,))
+    pump.daemon = True
+    pump.start()
+    try:
+        while True:
+            kind, payload = _recv(sock)
+            if kind == 'O':
+                sys.stdout.write(payload)
+                sys.stdout.flush()
+            elif kind == 'E':
+                sys.stderr.write(payload)
+                sys.stderr.flush()
+            elif kind == 'X':
+                return int(payload)
+    except (socket.error, EOFError):
+        sys.exit("lost connection to the gilliam agent")
+    finally:
+        sock.close()
+
+
+class _Writer(object):
+    """File-like object that sends what is written as frames."""
+
+    def __init__(self, sock, kind, lock):
+        self.sock = sock
+        self.kind = kind
+        self.lock = lock
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if data:
+            with self.lock:
+                _send(self.sock, self.kind, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+class _Reader(object):
+    """File-like object that reads stdin frames from the client."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self._buf = ''
+        self._eof = False
+
+    def _fill(self):
+        if self._eof:
+            return False
+        kind, payload = _recv(self.sock)
+        if not payload:
+            self._eof = True
+            return False
+        self._buf += payload
+        return True
+
+    def read(self, size=-1):
+        while (size < 0 or len(self._buf) < size) and self._fill():
+            pass
+        if size < 0:
+            size = len(self._buf)
+        data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def readline(self):
+        while '\n' not in self._buf and self._fill():
+            pass
+        end = self._buf.find('\n') + 1 or len(self._buf)
+        line, self._buf = self._buf[:end], self._buf[end:]
+        return line
+
+    def __iter__(self):
+        return iter(self.readline, '')
+
+    def isatty(self):
+        return False
+
+
+class Agent(object):
+    """Serve commands on the Unix socket at `path`.
+
+    :param app_factory: Called with stdin, stdout and stderr to create
+        the application that runs a command.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path, app_factory):
+        self.path = path
+        self.app_factory = app_factory
+        self._busy = threading.Lock()
+
+    def _bind(self):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.path)
+        except socket.error:
+            pass
+        else:
+            sys.exit("{0}: agent already running".format(self.path))
+        finally:
+            probe.close()
+        try:
+            os.unlink(self.path)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        try:
+            os.makedirs(os.path.dirname(self.path), 0700)
+        except EnvironmentError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0077)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(16)
+        return sock
+
+    def serve_forever(self):
+        sock = self._bind()
+        try:
+            while True:
+                conn, _ = sock.accept()
+                t = threading.Thread(target=self._handle, args=(conn,))
+                t.daemon = True
+                t.start()
+        finally:
+            sock.close()
+            os.unlink(self.path)
+
+    def _handle(self, conn):
+        try:
+            kind, payload = _recv(conn)
+            request = json.loads(payload)
+            if not self._busy.acquire(False):
+                _send(conn, 'B')
+                return
+            try:
+                _send(conn, 'K')
+                status = self._run(conn, request)
+            finally:
+                self._busy.release()
+            _send(conn, 'X', str(status))
+        except (socket.error, EOFError, ValueError) as err:
+            self.log.debug("request failed: {0}".format(err))
+        finally:
+            conn.close()
+
+    def _run(self, conn, request):
+        """Run a command with the working directory, environment and
+        standard streams of the client.  Log handlers that the command
+        installs are removed afterwards.
+        """
+        lock = threading.Lock()
+        stdin = _Reader(conn)
+        stdout = _Writer(conn, 'O', lock)
+        stderr = _Writer(conn, 'E', lock)
+        saved_cwd = os.getcwd()
+        saved_env = dict(os.environ)
+        saved_streams = sys.stdin, sys.stdout, sys.stderr
+        root_logger = logging.getLogger('')
+        saved_handlers = list(root_logger.handlers)
+        try:
+            os.chdir(request['cwd'])
+            os.environ.clear()
+            os.environ.update(request['env'])
+            sys.stdin, sys.stdout, sys.stderr = stdin, stdout, stderr
+            try:
+                return self.app_factory(stdin, stdout, stderr).run(
+                    request['argv'])
+            except SystemExit as exc:
+                if exc.code is None or isinstance(exc.code, int):
+                    return exc.code or 0
+                stderr.write('{0}\n'.format(exc.code))
+                return 1
+        finally:
+            root_logger.handlers[:] = saved_handlers
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(saved_cwd)
@@ -14,6 +14,7 @@
 
 from functools import partial
 from fnmatch import fnmatch
+import errno
 import os
 import sys
 import time
@@ -29,6 +30,7 @@ from contextlib import contextmanager
 from gilliam import errors
 
 from .docker import registry_from_repository, make_repository, DockerAuth
+from .tasks import TaskRunner
 
 
 @contextmanager
@@ -93,23 +95,94 @@ def read_ignore_patterns(dir, filename='.gilliam/ignore'):
                 if line and not line.startswith("#")]
 
 
-def _compute_tag(dir):
-    """Compute tag."""
+_TAG_CACHE_DIR = '~/.gilliam/cache/tag'
+
+
+def _walk(dir):
+    """Walk the directory, yielding `(dirpath, filenames)` for every
+    directory that should be part of the image.
+    """
     patterns = read_ignore_patterns(dir)
     patterns.extend(_EXCLUDE_DIRS)
     patterns.extend(_EXCLUDE_FILES)
 
-    h = hashlib.md5()
     for (dirpath, dirnames, filenames) in os.walk(dir):
         dirnames[:] = _filter(dirnames, patterns)
+        yield dirpath, _filter(filenames, patterns)
+
+
+def _read_tag_cache(path, fingerprint):
+    try:
+        with open(path) as fp:
+            cached_fingerprint, tag = fp.read().split()
+    except (EnvironmentError, ValueError):
+        return None
+    return tag if cached_fingerprint == fingerprint else None
+
+
+def _write_tag_cache(path, fingerprint, tag):
+    try:
+        try:
+            os.makedirs(os.path.dirname(path))
+        except EnvironmentError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        with open(path, 'w') as fp:
+            fp.write('{0} {1}\n'.format(fingerprint, tag))
+    except EnvironmentError:
+        pass
+
+
+def _compute_tag(dir, cache_dir=_TAG_CACHE_DIR, use_cached=False):
+    """Compute tag.
+
+    Reading every file is expensive, so the tag is cached together
+    with a fingerprint of the names, sizes and modification times of
+    the files.  The fingerprint misses a file that was changed without
+    changing its size or modification time, so the cached tag is only
+    returned if `use_cached` is true, which is good enough for showing
+    a plan but not for tagging an image that is deployed.
+
+    :param cache_dir: (Optional) Where to cache tags, or `None` to
+        disable caching.
+    :param use_cached: (Optional) Return the cached tag if the
+        fingerprint has not changed.
+    """
+    tree = list(_walk(dir))
+
+    f = hashlib.md5()
+    for dirpath, filenames in tree:
+        f.update(dirpath)
+        for filename in filenames:
+            st = os.stat(os.path.join(dir, dirpath, filename))
+            f.update('{0}\0{1}\0{2}\0{3!r}\0'.format(
+                filename, st.st_ino, st.st_size, st.st_mtime))
+    fingerprint = f.hexdigest()
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(
+            os.path.expanduser(cache_dir),
+            hashlib.md5(os.path.abspath(dir)).hexdigest())
+    if cache_path is not None and use_cached:
+        tag = _read_tag_cache(cache_path, fingerprint)
+        if tag is not None:
+            return tag
+
+    h = hashlib.md5()
+    for dirpath, filenames in tree:
         h.update(dirpath)
-        for filename in _filter(filenames, patterns):
+        for filename in filenames:
             h.update(filename)
             path = os.path.join(dir, dirpath, filename)
             with open(path, 'r') as fp:
                 for data in iter(partial(fp.read, 4096), ''):
                     h.update(data)
-    return h.hexdigest()[:8]
+    tag = h.hexdigest()[:8]
+
+    if cache_path is not None:
+        _write_tag_cache(cache_path, fingerprint, tag)
+    return tag
 
 
 class LogFile(object):
@@ -145,20 +218,37 @@ class ImageBuilder(object):
         return self.config.executor('%s.api.executor.service' % (
             alt['instance'],))
 
+    def image(self, dir):
+        """Return the name of the image that `build` would produce for
+        the directory, without building it.
+        """
+        return '{0}:{1}'.format(
+            make_repository(self.config, self.config.formation),
+            _compute_tag(dir, use_cached=True))
+
     def build(self, dir, push_image=True):
         """Build image from content of directory.
 
         :param bool push_image: If True, check credentials against
             registry since the built image will be pushed.
         """
-        self.executor = self._select_executor()
-        builder = self.config.builder(self.executor)
+        # executor discovery, credential check and hashing of the
+        # project are independent of each other.
+        runner = TaskRunner()
+        runner.add('executor', self._select_executor)
+        runner.add('tag', partial(_compute_tag, dir))
+        if push_image:
+            runner.add('credentials', partial(self._check_credentials,
+                                              self.config))
+        results = runner.run()
 
+        self.executor = results['executor']
+        builder = self.config.builder(self.executor)
         if push_image:
-            self.credentials = self._check_credentials(self.config)
+            self.credentials = results['credentials']
 
         self.repository = make_repository(self.config, self.config.formation)
-        self.tag = _compute_tag(dir)
+        self.tag = results['tag']
 
         self.log.info("start building image {0}:{1} ...".format(
             self.repository, self.tag))
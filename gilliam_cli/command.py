@@ -12,17 +12,127 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+"""Base classes for commands.
+
+`ListerCommand` and `ShowOneCommand` behave like cliff's `Lister` and
+`ShowOne`, but read their formatters from the entry point index of
+the command manager.  cliff's display commands find them through
+`pkg_resources`, which alone takes about as long to import as a
+short command takes to run.
+"""
+
+import itertools
+import logging
+
 from cliff.command import Command
-from cliff.lister import Lister
-from cliff.show import ShowOne
+
+from .plugins import EntryPointIndex
 
 
 __all__ = ['Command', 'ListerCommand', 'ShowOneCommand']
 
 
-class ListerCommand(Lister):
-    formatter_default = 'simple-table'
+class _DisplayCommand(Command):
+    """Command base class for displaying data.  Stand-in for
+    `cliff.display.DisplayCommandBase`.
+    """
 
+    log = logging.getLogger(__name__)
 
-class ShowOneCommand(ShowOne):
+    formatter_namespace = None
     formatter_default = 'simple-table'
+
+    def __init__(self, app, app_args):
+        super(_DisplayCommand, self).__init__(app, app_args)
+        self.load_formatter_plugins()
+
+    def load_formatter_plugins(self):
+        index = getattr(self.app.command_manager, 'index', None)
+        index = index if index is not None else EntryPointIndex()
+        self.formatters = {}
+        for ep in index.entry_points(self.formatter_namespace):
+            try:
+                self.formatters[ep.name] = ep.load()()
+            except Exception as err:
+                self.log.error(err)
+                if self.app_args.debug:
+                    raise
+
+    def get_parser(self, prog_name):
+        parser = super(_DisplayCommand, self).get_parser(prog_name)
+        formatter_group = parser.add_argument_group(
+            title='output formatters',
+            description='output formatter options')
+        formatter_choices = sorted(self.formatters.keys())
+        formatter_default = self.formatter_default
+        if formatter_default not in formatter_choices:
+            formatter_default = formatter_choices[0]
+        formatter_group.add_argument(
+            '-f', '--format', dest='formatter', action='store',
+            choices=formatter_choices, default=formatter_default,
+            help='the output format, defaults to %s' % formatter_default)
+        formatter_group.add_argument(
+            '-c', '--column', action='append', default=[], dest='columns',
+            metavar='COLUMN',
+            help='specify the column(s) to include, can be repeated')
+        for name, formatter in sorted(self.formatters.items()):
+            formatter.add_argument_group(parser)
+        return parser
+
+    def produce_output(self, parsed_args, column_names, data):
+        raise NotImplementedError
+
+    def run(self, parsed_args):
+        self.formatter = self.formatters[parsed_args.formatter]
+        column_names, data = self.take_action(parsed_args)
+        self.produce_output(parsed_args, column_names, data)
+        return 0
+
+
+class ListerCommand(_DisplayCommand):
+    """Command base class for providing a list of data as output."""
+
+    formatter_namespace = 'cliff.formatter.list'
+
+    def produce_output(self, parsed_args, column_names, data):
+        if not parsed_args.columns:
+            columns_to_include = column_names
+        else:
+            columns_to_include = [c for c in column_names
+                                  if c in parsed_args.columns]
+            if not columns_to_include:
+                raise ValueError('No recognized column names in %s' %
+                                 str(parsed_args.columns))
+            selector = [(c in columns_to_include) for c in column_names]
+            # The table formatters need the length of a row.
+            data = (list(itertools.compress(row, selector))
+                    for row in data)
+        self.formatter.emit_list(columns_to_include, data,
+                                 self.app.stdout, parsed_args)
+        return 0
+
+
+class ShowOneCommand(_DisplayCommand):
+    """Command base class for displaying data about a single object."""
+
+    formatter_namespace = 'cliff.formatter.show'
+
+    def produce_output(self, parsed_args, column_names, data):
+        if not parsed_args.columns:
+            columns_to_include = column_names
+        else:
+            columns_to_include = [c for c in column_names
+                                  if c in parsed_args.columns]
+            selector = [(c in columns_to_include) for c in column_names]
+            data = list(itertools.compress(data, selector))
+        self.formatter.emit_one(columns_to_include, data,
+                                self.app.stdout, parsed_args)
+        return 0
+
+    def dict2columns(self, data):
+        """Convert a dict to the two-column output that
+        `ShowOneCommand` expects.
+        """
+        if not data:
+            return ({}, {})
+        return zip(*sorted(data.items()))
@@ -0,0 +1,44 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from ..agent import Agent as _Agent, SOCKET_PATH
+from ..command import Command
+
+
+class Agent(Command):
+    """Run commands for `gilliam` from a resident process.
+
+    While the agent is running, `gilliam` hands commands over to it
+    instead of starting from scratch, and connections and lookups are
+    reused between commands.
+    """
+
+    def get_parser(self, prog_name):
+        parser = Command.get_parser(self, prog_name)
+        parser.add_argument('--socket', metavar='PATH', default=SOCKET_PATH,
+                            help="where to listen (default: %(default)s)")
+        return parser
+
+    def take_action(self, options):
+        app, shared = self.app, {}
+
+        def _make_app(stdin, stdout, stderr):
+            return type(app)(app.command_manager, app.service_manager,
+                             stdin, stdout, stderr, shared=shared)
+
+        agent = _Agent(options.socket, _make_app)
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -12,12 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
 import sys
 
 from ..build import ImageBuilder
 from ..command import Command
 from ..manifest import ProjectManifest
-from ..scheduler import Scheduler
+from ..scheduler import Scheduler, _merge_service_env
+from ..tasks import TaskRunner
 from .. import util
 
 
@@ -30,72 +32,120 @@ class _ServicesBuilder(object):
         self.config = config
         self.service_manager = service_manager
 
-    def build(self, defn, push_image=True):
+    def build(self, defn, push_image=True, build_image=True):
         """Build services from a project definition (contents of the
         `gilliam.yml` file).
 
         :param defn: The project definition.
         :type defn: dict.
 
+        :param build_image: If False, do not build the image for the
+            processes; only compute its name.
+
         :returns: The services.
         :rtype: dict.
         """
         services = {}
 
+        # every auxiliary service and the process image are built
+        # concurrently.
+        runner = TaskRunner()
+
         if 'auxiliary' in defn:
-            self._build_auxiliary(defn['auxiliary'], services)
+            self._build_auxiliary(defn['auxiliary'], runner)
 
         if 'processes' in defn:
-            self._build_processes(
-                self.config.project_dir, defn['processes'], services,
-                push_image
-                )
+            runner.add('processes', partial(
+                self._build_processes, self.config.project_dir,
+                defn['processes'], push_image, build_image))
 
+        for built in runner.run().values():
+            services.update(built)
         return services
 
-    def _build_processes(self, dir, processes, services, push_image):
-        """Build services for processes.  Store the result in `services`.
+    def _build_processes(self, dir, processes, push_image, build_image):
+        """Build services for processes.
 
         :param processes: The processes defined by the project.
         :type processes: dict(str:dict).
 
-        :param services: The services where the services should be stored.
-        :type services: dict.
+        :returns: The services.
+        :rtype: dict(str:dict).
         """
-        image = ImageBuilder(self.config).build(dir, push_image=push_image)
+        builder = ImageBuilder(self.config)
+        image = (builder.build(dir, push_image=push_image) if build_image
+                 else builder.image(dir))
+        services = {}
         for name, defn in processes.items():
             services[name] = {
                 'image': image, 'command': defn['script'],
                 'ports': defn.get('ports', []),
                 'env': defn.get('env', {})}
+        return services
 
-    def _build_auxiliary(self, aux, services):
-        """Build services from axualiary services in the project
-        definition.
+    def _build_auxiliary(self, aux, runner):
+        """Add tasks that build services from axualiary services in
+        the project definition.
 
         :param aux: Auxiliary services.
         :type aux: dict(str:dict).
 
-        :param services: The services where the services should be stored.
-        :type services: dict(str:dict).
+        :param runner: The runner the build tasks should be added to.
+        :type runner: TaskRunner.
         """
         for name, defn in aux.items():
-            service_type = defn.get('type')
-            if service_type:
-                try:
-                    service_ext = self.service_manager[service_type]
-                except KeyError:
-                    sys.exit("{0}: {1}: no such service".format(
-                        name, service_type))
+            runner.add(('auxiliary', name), partial(
+                self._build_auxiliary_service, name, defn))
+
+    def _build_auxiliary_service(self, name, defn):
+        """Build a single auxiliary service.
+
+        :returns: The service, keyed by its name.
+        :rtype: dict(str:dict).
+        """
+        service_type = defn.get('type')
+        if service_type:
+            try:
+                service_ext = self.service_manager[service_type]
+            except KeyError:
+                sys.exit("{0}: {1}: no such service".format(
+                    name, service_type))
+        else:
+            for ext in iter(self.service_manager):
+                if ext.obj.detect(name, defn):
+                    service_ext = ext
+                    break
             else:
-                for ext in iter(self.service_manager):
-                    if ext.obj.detect(name, defn):
-                        service_ext = ext
-                        break
-                else:
-                    sys.exit("{0}: cannot detect service".format(name))
-            service_obj = service_ext.obj
-            services[name] = service_obj.build(name, defn)
+                sys.exit("{0}: cannot detect service".format(name))
+        service_obj = service_ext.obj
+        return {name: service_obj.build(name, defn)}
+
+
+def _diff_service(old, new):
+    """Compare two definitions of a service, yielding a description
+    of every difference.
+    """
+    if old is None:
+        yield 'new service ({0})'.format(new.get('image'))
+        return
+    if new is None:
+        yield 'removed'
+        return
+
+    if old.get('image') != new.get('image'):
+        yield 'image {0} -> {1}'.format(old.get('image'), new.get('image'))
+    for key in ('command', 'ports'):
+        if old.get(key) != new.get(key):
+            yield '{0} {1!r} -> {2!r}'.format(key, old.get(key), new.get(key))
+
+    old_env, new_env = old.get('env') or {}, new.get('env') or {}
+    for var in sorted(set(old_env) | set(new_env)):
+        if var not in old_env:
+            yield 'env + {0}'.format(var)
+        elif var not in new_env:
+            yield 'env - {0}'.format(var)
+        elif old_env[var] != new_env[var]:
+            yield 'env ~ {0}'.format(var)
 
 
 class Deploy(Command):
@@ -124,23 +174,67 @@ class Deploy(Command):
             action='store_false',
             help="do not push built image to registry"
             )
+        parser.add_argument(
+            '--plan',
+            action='store_true',
+            help="show what would change, without building or releasing"
+            )
         return parser
 
     def take_action(self, options):
         rate = util.parse_rate(options.rate)
-        defn = ProjectManifest.load(self.app.config.project_dir)
 
         formation = Scheduler(self.app.config.scheduler()).formation(
             self.app.config.formation)
+        builder = _ServicesBuilder(self.app.config, self.app.service_manager)
+        build = partial(builder.build, push_image=options.push_image,
+                        build_image=not options.plan)
+
+        # fetch the last release while the services are being built.
+        runner = TaskRunner()
+        runner.add('manifest', partial(
+            ProjectManifest.load, self.app.config.project_dir))
+        runner.add('last_release', lambda: formation.last_release)
+        runner.add('services', build, requires=('manifest',))
+        if options.plan:
+            runner.add('instances', lambda: list(
+                self.app.config.scheduler().instances(
+                    self.app.config.formation)))
+        results = runner.run()
+
+        if options.plan:
+            self._plan(results['last_release'], results['services'],
+                       results['instances'])
+            return
 
-        services = _ServicesBuilder(
-            self.app.config, self.app.service_manager).build(
-                defn, push_image=options.push_image)
         name = formation.release(
             options.author,
             options.message,
-            services,
-            merge_env=True
+            results['services'],
+            merge_env=True,
+            current=results['last_release']
             )
         self.app.stdout.write('release {0}\n'.format(name))
         formation.migrate(name, rate)
+
+    def _plan(self, current, services, instances):
+        """Write out what a deploy would change compared to the
+        `current` release.
+        """
+        old = current.get('services', {}) if current else {}
+        new = _merge_service_env(old, services) if current else services
+
+        changed = set()
+        for name in sorted(set(old) | set(new)):
+            for change in _diff_service(old.get(name), new.get(name)):
+                self.app.stdout.write('{0}: {1}\n'.format(name, change))
+                changed.add(name)
+
+        if not changed:
+            self.app.stdout.write('no changes\n')
+            return
+
+        migrating = sum(1 for instance in instances
+                        if instance.get('service') in changed)
+        self.app.stdout.write('{0} instance(s) to migrate\n'.format(
+            migrating))
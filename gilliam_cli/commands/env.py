@@ -12,7 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import datetime
 import logging
+import re
 import yaml
 import sys
 
@@ -21,6 +23,7 @@ from ..command import Command
 from ..manifest import ProjectManifest
 from ..scheduler import Scheduler
 from .. import util
+from .. import yamlio
 
 
 class _CommonEnvCommand(Command):
@@ -37,6 +40,11 @@ class _CommonEnvCommand(Command):
             nargs='+',
             help="environment variable"
             )
+        self._add_release_arguments(parser)
+        return parser
+
+    def _add_release_arguments(self, parser):
+        """Add options that control how the new release is created."""
         parser.add_argument(
             '-r', '--release',
             default=None,
@@ -58,7 +66,6 @@ class _CommonEnvCommand(Command):
             '-a', '--apply',
             help="apply changes by migrating to new release"
             )
-        return parser
 
     def _split_var(self, var):
         """Try to split a variable definition (`var=value`) into variable
@@ -141,11 +148,11 @@ class Set(_CommonEnvCommand):
 
     def _set_globally(self, release, var, value):
         for service in release['services'].itervalues():
-            service.get('env', {}).update({var: value})
+            service.setdefault('env', {}).update({var: value})
 
     def _set_specific(self, release, name, var, value):
         service = release['services'].get(name, {})
-        service.get('env', {}).update({var: value})
+        service.setdefault('env', {}).update({var: value})
 
 
 class Unset(_CommonEnvCommand):
@@ -168,6 +175,255 @@ class Unset(_CommonEnvCommand):
         service.get('env', {}).pop(var, None)
 
 
+_VAR_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_DOTENV_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t', '"': '"', '\\': '\\'}
+
+_SINGLE_QUOTED_RE = re.compile(r"^'([^']*)'\Z")
+
+_DOUBLE_QUOTED_RE = re.compile(r'^"((?:[^"\\]|\\.)*)"\Z')
+
+
+def _unquote(value):
+    """Strip quotes from a dotenv value.  Double-quoted values may
+    contain backslash escapes, single-quoted values are taken
+    literally.
+
+    :raises: `ValueError` if a quoted value is not terminated.
+    """
+    if not value.startswith(("'", '"')):
+        return value
+    m = (_SINGLE_QUOTED_RE if value[0] == "'"
+         else _DOUBLE_QUOTED_RE).match(value)
+    if m is None:
+        raise ValueError("unterminated quote")
+    if value[0] == "'":
+        return m.group(1)
+    return re.sub(r'\\(.)', lambda esc: _DOTENV_ESCAPES.get(
+        esc.group(1), esc.group(0)), m.group(1))
+
+
+# Values that can be stored in the environment.
+_SCALAR_TYPES = (basestring, bool, int, long, float, datetime.date)
+
+
+def _encode(value):
+    """Return the scalar `value` as a UTF-8 encoded string.  Booleans
+    are spelled as in YAML and JSON.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value)
+
+
+def _quote(value):
+    """Quote a value so that it can be read back by `_unquote`."""
+    if value and re.match(r'^[A-Za-z0-9_./:,@%+-]+$', value):
+        return value
+    value = (value.replace('\\', '\\\\').replace('"', '\\"')
+             .replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t'))
+    return '"{0}"'.format(value)
+
+
+def parse_dotenv(fp):
+    """Parse a dotenv file, yielding `(lineno, scope, name, value)`
+    tuples.  The file is consumed one line at a time so that large
+    files never have to be held in memory.
+
+    Each line has the format `[export ][SCOPE:]NAME=VALUE`.  Blank
+    lines and lines starting with `#` are ignored.
+
+    :raises: `ValueError` if a line does not adhere to the format.
+    """
+    for lineno, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('export '):
+            line = line[len('export '):].lstrip()
+        try:
+            name, value = line.split('=', 1)
+        except ValueError:
+            raise ValueError("line {0}: invalid env var def format".format(
+                lineno))
+        try:
+            scope, name = name.strip().split(':', 1)
+        except ValueError:
+            scope, name = None, name.strip()
+        try:
+            value = _unquote(value.strip())
+        except ValueError as err:
+            raise ValueError("line {0}: {1}".format(lineno, err))
+        yield lineno, scope, name, value
+
+
+def parse_yaml_env(fp):
+    """Parse a YAML environment file, yielding `(lineno, scope, name,
+    value)` tuples.  Top-level scalars are global variables, top-level
+    mappings hold variables for the service with that name (the same
+    format as `env` and `export env` produce).  Unlike a dotenv file,
+    the whole document is loaded before the first variable is
+    yielded.
+
+    :raises: `ValueError` if the document does not adhere to the format.
+    """
+    data = yamlio.load(fp) or {}
+    if not isinstance(data, dict):
+        raise ValueError("top-level element must be a mapping")
+    for key, value in data.items():
+        if isinstance(value, dict):
+            for name, val in value.items():
+                yield None, key, name, val
+        else:
+            yield None, None, key, value
+
+
+class Import(Set):
+    """\
+    Set environment variables from a file in a new release.
+
+    The file is either a dotenv file with one `[SCOPE:]NAME=VALUE`
+    definition per line, or a YAML document as produced by `export
+    env --format yaml`.  All variables are validated before anything
+    is sent to the scheduler, and the whole batch is applied in a
+    single release.
+
+    Dotenv files are read a line at a time; a YAML document is loaded
+    as a whole, so use the dotenv format for very large files.
+    """
+
+    _PARSERS = {'dotenv': parse_dotenv, 'yaml': parse_yaml_env}
+
+    def get_parser(self, prog_name):
+        parser = Command.get_parser(self, prog_name)
+        parser.add_argument(
+            'file',
+            help="file to read variables from, or '-' for stdin"
+            )
+        parser.add_argument(
+            '--format',
+            choices=sorted(self._PARSERS),
+            default=None,
+            help="format of the file (default: guess from file name)"
+            )
+        self._add_release_arguments(parser)
+        return parser
+
+    def _guess_format(self, fn):
+        return ('yaml' if fn.endswith('.yml') or fn.endswith('.yaml')
+                else 'dotenv')
+
+    def _read_vars(self, fp, fmt):
+        """Read and validate all definitions in the file.
+
+        :returns: a list of `(scope, name, value)` tuples.
+        """
+        result, errors = [], []
+        try:
+            for lineno, scope, name, value in self._PARSERS[fmt](fp):
+                where = ("line {0}: ".format(lineno) if lineno is not None
+                         else "")
+                if (not isinstance(name, basestring)
+                        or not _VAR_NAME_RE.match(name)):
+                    errors.append("{0}{1}: invalid variable name".format(
+                        where, _encode(name)))
+                elif not isinstance(value, _SCALAR_TYPES):
+                    errors.append("{0}{1}: value must be a scalar".format(
+                        where, name))
+                else:
+                    result.append((scope and _encode(scope), str(name),
+                                   _encode(value)))
+        except (ValueError, yaml.YAMLError) as err:
+            errors.append(str(err))
+        if errors:
+            sys.exit('\n'.join(errors))
+        return result
+
+    def take_action(self, options):
+        fmt = options.format or self._guess_format(options.file)
+        if options.file == '-':
+            options.var = self._read_vars(self.app.stdin, fmt)
+        else:
+            with open(options.file) as fp:
+                options.var = self._read_vars(fp, fmt)
+        if not options.var:
+            sys.exit("{0}: no variables".format(options.file))
+        return super(Import, self).take_action(options)
+
+    def update_env(self, formation, release, vars):
+        unknown = set(scope for (scope, name, value) in vars
+                      if scope and scope not in release['services'])
+        if unknown:
+            sys.exit("no such service in release {0}: {1}".format(
+                release['name'], ', '.join(sorted(unknown))))
+        for scope, name, value in vars:
+            if not scope:
+                self._set_globally(release, name, value)
+            else:
+                self._set_specific(release, scope, name, value)
+
+
+class Export(Command):
+    """\
+    Export the environment of a release.
+
+    The output can be read back with `import env`.
+    """
+
+    requires = {'formation': True}
+
+    def get_parser(self, prog_name):
+        parser = Command.get_parser(self, prog_name)
+        parser.add_argument(
+            "service",
+            nargs='?',
+            help="specific service to export variables for"
+            )
+        parser.add_argument(
+            '-r', '--release',
+            default=None,
+            help="release other than latest"
+            )
+        parser.add_argument(
+            '--format',
+            choices=sorted(Import._PARSERS),
+            default='dotenv',
+            help="output format"
+            )
+        return parser
+
+    def take_action(self, options):
+        formation = Scheduler(self.app.config.scheduler()).formation(
+            self.app.config.formation)
+        release = (formation.find_release(options.release) if options.release
+                   else formation.last_release)
+        if not release:
+            sys.exit("no release")
+
+        services = release['services']
+        if options.service:
+            if options.service not in services:
+                sys.exit("{0}: no such service".format(options.service))
+            services = {options.service: services[options.service]}
+        output = {name: defn.get('env', {})
+                  for (name, defn) in services.items() if defn.get('env')}
+
+        if options.format == 'yaml':
+            if output:
+                yamlio.dump(output, self.app.stdout,
+                            default_flow_style=False, allow_unicode=True)
+            return
+        for name in sorted(output):
+            for var in sorted(output[name]):
+                self.app.stdout.write('{0}:{1}={2}\n'.format(
+                    _encode(name), _encode(var),
+                    _quote(_encode(output[name][var]))))
+
+
 class Show(Command):
     """show environment for release"""
 
@@ -203,4 +459,4 @@ class Show(Command):
                 output[name] = defn.get('env', {})
             output = {name: env for (name, env) in output.items() if env}
         if output:
-            yaml.safe_dump(output, self.app.stdout, default_flow_style=False)
+            yamlio.dump(output, self.app.stdout, default_flow_style=False)
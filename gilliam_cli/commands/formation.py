@@ -12,11 +12,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from contextlib import closing
 from urllib import urlopen
-import yaml
 
 from ..config import FormationConfig
 from ..command import Command
+from .. import yamlio
 
 
 # Name of the initial release.
@@ -51,13 +52,13 @@ class Launch(Command):
     def _read_release(self, fn):
         """Read release manifest and return it as a python C{dict}."""
         if fn.startswith("http://") or fn.startswith("https://"):
-            with urlopen(fn) as fp:
-                return yaml.load(fp)
+            with closing(urlopen(fn)) as fp:
+                return yamlio.load(fp)
         elif fn == '-':
-            return yaml.load(self.app.stdin)
+            return yamlio.load(self.app.stdin)
         else:
             with open(fn) as fp:
-                return yaml.load(fp)
+                return yamlio.load(fp)
 
 
 class Create(Command):
@@ -80,5 +81,5 @@ class Create(Command):
         form_config = FormationConfig.make(self.app.config.project_dir)
         form_config.formation = formation['name']
 
-        if self.app.options.stage:
-            form_config.stage = self.app.options.stage
+        if self.app.config.stage:
+            form_config.stage = self.app.config.stage
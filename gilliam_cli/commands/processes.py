@@ -12,27 +12,187 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import Counter
+from functools import partial
 import sys
+import time
 
 from ..command import ListerCommand, Command
+from ..formatter import LiveTable
 from ..scheduler import Scheduler
-from ..util import parse_rate, parse_scale
+from ..tasks import TaskRunner
+from ..util import parse_rate, parse_scale, prefetch, terminal_size
 from ..port_spec import merge_port_specs
 
 
 class ProcessStatus(ListerCommand):
-    """Display running instances."""
+    """\
+    Display running instances.
+
+    Instances can be filtered using `--service`, `--release`,
+    `--state` and `--assigned-to`.  Each filter can be given more than
+    once to accept several values.  Use `-c FIELD` to only show some
+    of the fields.
+
+    Give `--summary` to only show the number of instances per service
+    and state, per release and per executor.  Releases other than the
+    latest one are flagged.  `-c` cannot be combined with it.
+
+    Give `--watch` to keep the view open.  The instances are fetched
+    again every `--interval` seconds; if nothing changes the interval
+    is gradually increased.  Press Ctrl-C to stop watching.
+    """
 
     requires = {'formation': True}
 
     FIELDS = ('name', 'release', 'state', 'status', 'reason', 'assigned_to', 'image', 'command')
 
+    # The watch interval is never backed off more than this.
+    _MAX_BACKOFF = 8
+
+    # Fields that instances can be filtered on.
+    FILTERS = ('service', 'release', 'state', 'assigned_to')
+
+    SUMMARY_FIELDS = ('group', 'key', 'count', 'note')
+
+    def get_parser(self, prog_name):
+        parser = ListerCommand.get_parser(self, prog_name)
+        for name in self.FILTERS:
+            parser.add_argument(
+                '--' + name.replace('_', '-'),
+                dest=name,
+                action='append',
+                default=[],
+                metavar='VALUE',
+                help="only show instances with this {0}".format(name)
+                )
+        # the summary is not kept up to date when watching.
+        modes = parser.add_mutually_exclusive_group()
+        modes.add_argument(
+            '--summary',
+            action='store_true',
+            help="only show instance counts"
+            )
+        modes.add_argument(
+            '-w', '--watch',
+            action='store_true',
+            help="keep watching instances"
+            )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            metavar='SECS',
+            help="shortest time between refreshes when watching"
+            )
+        return parser
+
+    def _fields(self, options):
+        """Return the fields to show, as selected with `-c`."""
+        columns = getattr(options, 'columns', None)
+        if not columns:
+            return self.FIELDS
+        unknown = [c for c in columns if c not in self.FIELDS]
+        if unknown:
+            sys.exit("unknown field(s): {0}".format(', '.join(unknown)))
+        return tuple(f for f in self.FIELDS if f in columns)
+
+    def _filters(self, options):
+        return {name: getattr(options, name) for name in self.FILTERS}
+
+    def _instances(self, formation, options):
+        return prefetch(formation.instances(**self._filters(options)),
+                        self.app.config.stage_config.prefetch)
+
+    def _rows(self, formation, options):
+        for name, row in self._keyed_rows(formation, options):
+            yield row
+
+    def _keyed_rows(self, formation, options):
+        """Yield `(name, row)` for every instance; the name identifies
+        the instance even if it is not one of the fields shown.
+        """
+        fields = self._fields(options)
+        for instance in self._instances(formation, options):
+            yield instance.get('name'), [instance.get(f) for f in fields]
+
+    def _count(self, formation, options):
+        """Count instances in a single pass over the instance stream.
+        Only the counters are kept in memory.
+        """
+        by_state, by_release, by_executor = Counter(), Counter(), Counter()
+        for instance in self._instances(formation, options):
+            by_state[(instance.get('service'), instance.get('state'))] += 1
+            by_release[instance.get('release')] += 1
+            by_executor[instance.get('assigned_to')] += 1
+        return by_state, by_release, by_executor
+
+    def _summary(self, formation, options):
+        runner = TaskRunner()
+        runner.add('latest', lambda: formation.last_release)
+        runner.add('counts', partial(self._count, formation, options))
+        results = runner.run()
+        latest = results['latest']['name'] if results['latest'] else None
+        by_state, by_release, by_executor = results['counts']
+
+        for (service, state), count in sorted(by_state.items()):
+            yield ['service/state', '{0}/{1}'.format(service, state),
+                   count, '']
+        for release, count in sorted(by_release.items()):
+            note = ('behind latest release {0}'.format(latest)
+                    if latest is not None and release != latest else '')
+            yield ['release', release, count, note]
+        for executor, count in sorted(by_executor.items()):
+            yield ['assigned_to', executor, count, '']
+
+    def _formation(self):
+        return Scheduler(self.app.config.scheduler()).formation(
+            self.app.config.formation)
+
     def take_action(self, options):
-        def it(scheduler):
-            for instance in scheduler.instances(self.app.config.formation):
-                yield [instance.get(f) for f in self.FIELDS]
+        if options.summary:
+            if options.columns:
+                sys.exit("-c cannot be used with --summary")
+            return (self.SUMMARY_FIELDS,
+                    self._summary(self._formation(), options))
+        return self._fields(options), self._rows(self._formation(), options)
+
+    def run(self, parsed_args):
+        if not parsed_args.watch:
+            return ListerCommand.run(self, parsed_args)
+        try:
+            self._watch(parsed_args)
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    def _watch(self, options):
+        """Refresh the instance table until interrupted.  The same
+        scheduler client, and thereby the same HTTP session, is used
+        for every refresh.
+        """
+        formation = self._formation()
+        fields = self._fields(options)
+        tty = self.app.stdout.isatty()
+        table = LiveTable(
+            fields, self.app.stdout, tty,
+            height=(terminal_size(self.app.stdout.fileno())[1]
+                    if tty else None),
+            highlight='state' if 'state' in fields else None)
 
-        return self.FIELDS, it(self.app.config.scheduler())
+        interval = options.interval
+        while True:
+            t0 = time.time()
+            rows = sorted(self._keyed_rows(formation, options))
+            elapsed = time.time() - t0
+            if table.update(rows):
+                interval = options.interval
+            else:
+                interval = min(interval * 1.5,
+                               options.interval * self._MAX_BACKOFF)
+            # do not spend more than half the time talking to the
+            # scheduler.
+            time.sleep(max(interval, elapsed))
 
 
 class Scale(Command):
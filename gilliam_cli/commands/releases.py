@@ -13,11 +13,12 @@
 # limitations under the License.
 
 import os
-import yaml
 import sys
 
 from ..command import Command, ListerCommand
 from ..scheduler import Scheduler
+from ..util import prefetch
+from .. import yamlio
 
 
 class Releases(ListerCommand):
@@ -32,7 +33,9 @@ class Releases(ListerCommand):
     def take_action(self, options):
         """Handle the command."""
         def it(scheduler):
-            for instance in scheduler.releases(self.app.config.formation):
+            releases = prefetch(scheduler.releases(self.app.config.formation),
+                                self.app.config.stage_config.prefetch)
+            for instance in releases:
                 yield [instance.get(f) for f in self.FIELDS]
 
         return self.FIELDS, it(self.app.config.scheduler())
@@ -56,4 +59,4 @@ class DumpRelease(Command):
             self.app.config.formation)
         release = (formation.find_release(options.release) if options.release
                    else formation.last_release)
-        yaml.safe_dump(release, self.app.stdout, default_flow_style=False)
+        yamlio.dump(release, self.app.stdout, default_flow_style=False)
@@ -12,11 +12,68 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from functools import partial
 import sys
 
 import shortuuid
 
 from ..command import Command, ListerCommand
+from ..routing import RouteIndex, split_url
+from ..tasks import TaskRunner
+from .. import yamlio
+
+
+def parse_route(route):
+    """Split `route` (`[domain]/path`) into domain and path.  The
+    domain is `None` if not given.
+    """
+    domain, path = route.split('/', 1)
+    domain = domain if domain else None
+    path = '/{0}'.format(path)
+    return domain, path
+
+
+def http_target(target):
+    # Always assume that we're dealing with HTTP.
+    if not target.startswith('http://'):
+        target = 'http://' + target
+    return target
+
+
+def format_route(domain, path):
+    return '{0}{1}'.format(domain or '', path)
+
+
+def read_routes(fn):
+    """Read a file of routes, as used by `apply routes`.
+
+    :returns: A list of `(domain, path, target)` keys, in file
+        order and without duplicates.
+    """
+    # imported here so that the other route commands do not pay for
+    # importing yaml.
+    import yaml
+    try:
+        with open(fn) as fp:
+            data = yamlio.load(fp)
+    except (EnvironmentError, yaml.YAMLError) as err:
+        sys.exit("{0}: {1}".format(fn, err))
+    if isinstance(data, dict):
+        data = data.get('routes')
+    if not isinstance(data, list):
+        sys.exit("{0}: expected a list of routes".format(fn))
+
+    wanted = []
+    for n, entry in enumerate(data, 1):
+        try:
+            domain, path = parse_route(entry['route'])
+            key = (domain, path, http_target(entry['target']))
+        except (KeyError, TypeError, AttributeError, ValueError):
+            sys.exit("{0}: route {1}: need `route` and `target`".format(
+                fn, n))
+        if key not in wanted:
+            wanted.append(key)
+    return wanted
 
 
 class Route(Command):
@@ -53,12 +110,6 @@ class Route(Command):
             )
         return parser
 
-    def _parse_route(self, route):
-        domain, path = route.split('/', 1)
-        domain = domain if domain else None
-        path = '/{0}'.format(path)
-        return domain, path
-
     def _delete(self, router, options):
         router.delete(options.route)
 
@@ -66,12 +117,9 @@ class Route(Command):
         if not options.target:
             sys.exit("must specify route target")
 
-        # Always assume that we're dealing with HTTP.
-        if not options.target.startswith('http://'):
-            options.target = 'http://' + options.target
-
-        domain, path = self._parse_route(options.route)
-        route = router.create(shortuuid.uuid(), domain, path, options.target)
+        domain, path = parse_route(options.route)
+        route = router.create(shortuuid.uuid(), domain, path,
+                              http_target(options.target))
         self.app.stdout.write('route {0}\n'.format(route['name']))
 
     def take_action(self, options):
@@ -91,3 +139,220 @@ class Routes(ListerCommand):
             for route in router.routes():
                 yield [route.get(f) for f in fields]
         return self.FIELDS, it(self.app.config.router(), self.FIELDS)
+
+
+class ApplyRoutes(Command):
+    """\
+    Make the routes of the router match a file.
+
+    The file is a YAML list of routes, each with a `route` and a
+    `target` written as for the `route` command:
+
+      - route: api.domain.tld/{rest:.*?}
+        target: api.service/{rest}
+      - route: /login/{provider}
+        target: auth.service/{provider}
+
+    Routes in the file that the router does not have are created.
+    With `--prune`, routes that are not in the file are deleted.  Two
+    routes are the same if they have the same domain, path and
+    target.  Give `--dry-run` to only show what would be done.
+    """
+
+    def get_parser(self, prog_name):
+        parser = Command.get_parser(self, prog_name)
+        parser.add_argument(
+            '-n', '--dry-run',
+            action='store_true',
+            help="show changes without making them"
+            )
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help="delete routes that are not in the file"
+            )
+        parser.add_argument(
+            'file',
+            metavar='FILE'
+            )
+        return parser
+
+    def _plan(self, wanted, current, prune):
+        """Compute the changes that make `current` match `wanted`.
+
+        :returns: The keys to create, and the routes to delete.
+        """
+        existing = {}
+        duplicates = []
+        for route in current:
+            key = (route.get('domain'), route['path'], route['target'])
+            if key in existing:
+                duplicates.append(route)
+            else:
+                existing[key] = route
+        create = [wanted_key for wanted_key in wanted
+                  if wanted_key not in existing]
+        delete = []
+        if prune:
+            wanted = set(wanted)
+            delete = [existing[existing_key] for existing_key in existing
+                      if existing_key not in wanted] + duplicates
+            delete.sort(key=lambda r: r['name'])
+        return create, delete
+
+    def take_action(self, options):
+        wanted = read_routes(options.file)
+        router = self.app.config.router()
+        create, delete = self._plan(wanted, router.routes(), options.prune)
+
+        for domain, path, target in create:
+            self.app.stdout.write('create {0} -> {1}\n'.format(
+                format_route(domain, path), target))
+        for route in delete:
+            self.app.stdout.write('delete {0} {1} -> {2}\n'.format(
+                route['name'], format_route(route.get('domain'),
+                                            route['path']),
+                route['target']))
+        if options.dry_run or not (create or delete):
+            return 0
+
+        # all requests go to the router, so run no more of them at
+        # once than there are connections to it in the pool.  Routes
+        # are created before old ones are deleted, so that a path
+        # whose target changes is never left without a route.
+        max_workers = self.app.config.stage_config.pool_maxsize
+        runner = TaskRunner(max_workers=max_workers)
+        for domain, path, target in create:
+            runner.add(('create', domain, path, target),
+                       partial(router.create, shortuuid.uuid(), domain,
+                               path, target))
+        runner.run()
+        runner = TaskRunner(max_workers=max_workers)
+        for route in delete:
+            runner.add(('delete', route['name']),
+                       partial(router.delete, route['name']))
+        runner.run()
+        self.app.stdout.write('{0} created, {1} deleted\n'.format(
+            len(create), len(delete)))
+        return 0
+
+
+class _IndexMixin(object):
+    """Build a `RouteIndex` from the router, or from a file given
+    with `--file`.
+    """
+
+    def _add_file_argument(self, parser):
+        parser.add_argument(
+            '--file',
+            metavar='FILE',
+            help="use the routes in FILE (as for `apply routes`)"
+            )
+
+    def _routes(self, options):
+        if not options.file:
+            return self.app.config.router().routes()
+        return [{'name': '{0}:{1}'.format(options.file, n),
+                 'domain': domain, 'path': path, 'target': target}
+                for n, (domain, path, target) in enumerate(
+                    read_routes(options.file), 1)]
+
+    def _index(self, options):
+        try:
+            return RouteIndex(self._routes(options))
+        except ValueError as err:
+            sys.exit(str(err))
+
+
+class TestRoute(_IndexMixin, ListerCommand):
+    """\
+    Show which route a URL takes.
+
+    The URL is matched against the route table without sending any
+    request.  The route that the router picks is shown with the
+    target that the request is forwarded to.  Give `--all` to also
+    show every other route that matches, in order of preference.
+
+      gilliam test route api.domain.tld/v1/users
+    """
+
+    FIELDS = ('name', 'domain', 'path', 'target', 'forward_to')
+
+    def get_parser(self, prog_name):
+        parser = ListerCommand.get_parser(self, prog_name)
+        self._add_file_argument(parser)
+        parser.add_argument(
+            '-a', '--all',
+            action='store_true',
+            help="show all matching routes"
+            )
+        parser.add_argument(
+            'url',
+            metavar='URL'
+            )
+        return parser
+
+    def take_action(self, options):
+        index = self._index(options)
+        host, path = split_url(options.url)
+        try:
+            if options.all:
+                matches = index.match_all(host, path)
+            else:
+                match = index.match(host, path)
+                matches = [match] if match is not None else []
+        except ValueError as err:
+            sys.exit(str(err))
+        if not matches:
+            sys.exit("{0}: no route matches".format(options.url))
+        return self.FIELDS, [
+            [route.name, route.domain, route.path, route.route['target'],
+             route.rewrite(variables)]
+            for (route, variables) in matches]
+
+
+class CheckRoutes(_IndexMixin, ListerCommand):
+    """\
+    Find routes that shadow each other.
+
+    For every route a URL that it should handle is made up and
+    matched against the table, on the route's own domain and on the
+    domains of the other routes that could take the same path.  A
+    route is reported as shadowed if another route is picked for one
+    of those URLs.  Give `--overlaps` to also report routes that get
+    the URL but where another route matches it too.
+
+    Only one path is tried per route, so routes that conflict only on
+    other paths are not reported.
+    """
+
+    FIELDS = ('name', 'route', 'problem', 'other', 'other_route', 'example')
+
+    def get_parser(self, prog_name):
+        parser = ListerCommand.get_parser(self, prog_name)
+        self._add_file_argument(parser)
+        parser.add_argument(
+            '--overlaps',
+            action='store_true',
+            help="also report overlapping routes"
+            )
+        return parser
+
+    def take_action(self, options):
+        def it(index):
+            for route, other, shadowed, url in index.conflicts():
+                if not (shadowed or options.overlaps):
+                    continue
+                yield [route.name, format_route(route.domain, route.path),
+                       'shadowed by' if shadowed else 'overlaps',
+                       other.name, format_route(other.domain, other.path),
+                       url]
+        # compile every route up front, so that a bad template is
+        # reported before any output.
+        index = self._index(options)
+        for route in index.routes:
+            try:
+                route.match(None, '')
+            except ValueError as err:
+                sys.exit(str(err))
+        return self.FIELDS, it(index)
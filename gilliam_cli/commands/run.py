@@ -13,20 +13,27 @@
 # limitations under the License.
 
 from functools import partial
+import argparse
 import contextlib
-import fcntl
+import errno
+import logging
 import random
+import select
 import signal
 import sys
-import struct
 import os
 import termios
-import yaml
+import threading
+import time
+import zlib
 
 from gilliam.util import thread
 
 from ..scheduler import Scheduler
 from ..command import Command
+from ..tasks import TaskRunner
+from ..util import prefetch, terminal_size
+from .. import yamlio
 
 
 @contextlib.contextmanager
@@ -53,12 +60,194 @@ def istty(app):
     return os.isatty(app.stdin.fileno())
 
 
-def terminal_size(fd):
-    h, w, hp, wp = struct.unpack(
-        'HHHH',
-        fcntl.ioctl(fd, termios.TIOCGWINSZ,
-                    struct.pack('HHHH', 0, 0, 0, 0)))
-    return w, h
+# Largest chunk of terminal input that is sent to the process at once.
+_TTY_FRAME_SIZE = 16 * 1024
+
+
+def _retry(fn, *args):
+    """Call `fn`, restarting it if it is interrupted by a signal."""
+    while True:
+        try:
+            return fn(*args)
+        except (OSError, select.error) as err:
+            if err.args[0] != errno.EINTR:
+                raise
+
+
+def _readable(fd, timeout=None):
+    return bool(_retry(select.select, [fd], [], [], timeout)[0])
+
+
+def read_available(fd, limit=_TTY_FRAME_SIZE):
+    """Read from the file descriptor `fd`, yielding everything that
+    has arrived as a single chunk of at most `limit` bytes.  A
+    keystroke is passed on as soon as it is typed, while pasted text
+    goes out in large chunks instead of byte by byte.
+    """
+    eof = False
+    while not eof:
+        _readable(fd)
+        chunks, size = [], 0
+        while size < limit and (not chunks or _readable(fd, 0)):
+            chunk = _retry(os.read, fd, limit - size)
+            if not chunk:
+                eof = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if chunks:
+            yield ''.join(chunks)
+
+
+class RawWriter(object):
+    """File-like object that writes straight to the file descriptor
+    `fd`, without Python's buffering, so that output shows up as soon
+    as it arrives and costs one system call per chunk.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        written = 0
+        while written < len(data):
+            written += _retry(os.write, self.fd, buffer(data, written))
+
+    def flush(self):
+        pass
+
+    def fileno(self):
+        return self.fd
+
+
+# Size of the chunks that piped input is read and sent in.
+_BULK_CHUNK_SIZE = 1024 * 1024
+
+# Number of chunks of piped input that are read ahead of the process.
+_BULK_READ_AHEAD = 4
+
+
+def read_bulk(fd, chunk_size=_BULK_CHUNK_SIZE):
+    """Read from the file descriptor `fd` until end of file, yielding
+    chunks of up to `chunk_size` bytes.
+    """
+    while True:
+        chunk = _retry(os.read, fd, chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of chunks into a gzip stream."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Meter(object):
+    """Counts the bytes of chunks passing through `count`."""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def count(self, chunks):
+        for chunk in chunks:
+            self.bytes += len(chunk)
+            yield chunk
+
+
+class _MeteredWriter(object):
+
+    def __init__(self, output, meter):
+        self.output = output
+        self.meter = meter
+
+    def write(self, data):
+        self.meter.bytes += len(data)
+        self.output.write(data)
+
+    def flush(self):
+        self.output.flush()
+
+
+def _rate(nbytes, elapsed):
+    return '{0:.1f} MB ({1:.1f} MB/s)'.format(
+        nbytes / 1e6, nbytes / 1e6 / elapsed if elapsed else 0)
+
+
+class PrefixWriter(object):
+    """File-like object that writes complete lines to `output`, each
+    prefixed with `prefix`.  Writers for several processes can share
+    `output` (and `lock`) without their lines getting mixed up.
+    """
+
+    # Longest partial line that is held back waiting for a newline.
+    _MAX_PARTIAL = 64 * 1024
+
+    def __init__(self, output, prefix, lock):
+        self.output = output
+        self.prefix = prefix
+        self.lock = lock
+        self._partial = ''
+
+    def _emit(self, lines):
+        with self.lock:
+            self.output.write(''.join(
+                '{0}{1}\n'.format(self.prefix, line) for line in lines))
+            self.output.flush()
+
+    def write(self, data):
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        if len(self._partial) > self._MAX_PARTIAL:
+            lines.append(self._partial)
+            self._partial = ''
+        if lines:
+            self._emit(lines)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Write out what is left of an unterminated last line."""
+        if self._partial:
+            self._emit([self._partial])
+            self._partial = ''
+
+
+def two_choices(candidates, sources, rng=random):
+    """Pick the less loaded of two random candidates ("power of two
+    choices"), which spreads work almost as well as asking every
+    candidate for its load, at the cost of asking two.
+
+    :param sources: Functions that are called with a candidate and
+        return its load, or `None` if they do not know it.  The first
+        one that knows the load of both candidates decides; if none
+        does, the pick is random.
+    """
+    if len(candidates) <= 2:
+        sample = list(candidates)
+    else:
+        sample = rng.sample(candidates, 2)
+    for load in sources:
+        loads = [load(candidate) for candidate in sample]
+        if None not in loads:
+            return sample[loads.index(min(loads))]
+    return rng.choice(sample)
+
+
+def _announced(field, alt):
+    """Return the value of `field` that an executor announces in the
+    service registry, as a load.
+    """
+    value = alt.get(field)
+    return float(value) if value is not None else None
 
 
 class Run(Command):
@@ -81,14 +270,48 @@ class Run(Command):
     Give `--tty` to force a TTY to be opened for the command (will
     normally only be done if a TTY is connected to the current
     terminal).
+
+    Without a TTY, input is streamed to the command in large chunks
+    that are read ahead while earlier chunks are being sent, and the
+    amount of data transferred is logged when the command exits.  With
+    `--compress`, input is sent gzip-compressed and the command has
+    to decompress it:
+
+      gilliam run --compress db sh -c 'gunzip | psql' < dump.sql
+
+    To run the command on every executor, give `--all-executors`.
+    With `--parallel N` the command runs on N executors picked at
+    random, or, together with `--all-executors`, on N executors at a
+    time.  Every line of output is prefixed with the executor it came
+    from, and the exit status from each executor is listed at the
+    end:
+
+      gilliam run --all-executors gilliam/base du -sh /var/cache
+
+    The executor is picked at random unless `--placement` says
+    otherwise: `least-loaded` picks the less loaded of two random
+    executors, and any other value names the executor to use.  The
+    load of an executor is the `load` or else the `containers` it
+    announces in the service registry, or else the number of
+    containers its client lists.
     """
 
+    log = logging.getLogger(__name__)
+
     requires = {'formation': True}
 
     def get_parser(self, prog_name):
         parser = Command.get_parser(self, prog_name)
         parser.add_argument(
-            '--executor'
+            '--placement',
+            metavar='STRATEGY',
+            default='random',
+            help="random, least-loaded, or the name of an executor"
+            )
+        parser.add_argument(
+            '--executor',
+            dest='placement',
+            help=argparse.SUPPRESS
             )
         parser.add_argument(
             '-s', '--service',
@@ -111,6 +334,22 @@ class Run(Command):
             action='store_true',
             help="force tty input"
             )
+        parser.add_argument(
+            '--all-executors',
+            action='store_true',
+            help="run the command on every executor"
+            )
+        parser.add_argument(
+            '--parallel',
+            metavar='N',
+            type=int,
+            help="run the command on N executors at once"
+            )
+        parser.add_argument(
+            '--compress',
+            action='store_true',
+            help="send input gzip-compressed (when not using a tty)"
+            )
         parser.add_argument(
             'image'
             )
@@ -121,15 +360,7 @@ class Run(Command):
         return parser
 
     def take_action(self, options):
-        instance = self._select_executor(options)
-        executor = self.app.config.executor(
-            '{0}.api.executor.service'.format(instance['instance']))
-
         env = {}
-        tty = istty(self.app) or options.tty
-        reader = (iter(partial(self.app.stdin.read, 1), '') if tty else
-                  iter(partial(self.app.stdin.read, 4096), ''))
-
         if options.service:
             self._service(options, env)
 
@@ -138,6 +369,30 @@ class Run(Command):
 
         command = None if not options.command else options.command
 
+        if options.parallel is not None and options.parallel < 1:
+            sys.exit("--parallel must be at least 1")
+        if options.all_executors or options.parallel:
+            if options.compress:
+                sys.exit("--compress cannot be used with more than one "
+                         "executor, since no input is sent")
+            sys.exit(self._fan_out(options, env, command))
+
+        tty = istty(self.app) or options.tty
+        if tty and options.compress:
+            sys.exit("--compress cannot be used with a tty")
+
+        instance = self._select_executor(options)
+        executor = self.app.config.executor(
+            '{0}.api.executor.service'.format(instance['instance']))
+        if tty:
+            reader = read_available(self.app.stdin.fileno())
+            output = RawWriter(self.app.stdout.fileno())
+        else:
+            received, sent = Meter(), Meter()
+            reader = self._bulk_reader(options, received, sent)
+            output = _MeteredWriter(
+                RawWriter(self.app.stdout.fileno()), Meter())
+
         process = executor.run(
             self.app.config.formation, options.image,
             env, command, tty=tty)
@@ -147,16 +402,110 @@ class Run(Command):
             with console():
                 old_handler = signal.signal(signal.SIGWINCH, partial(
                     self._winch, process))
-                thread(process.attach, reader, self.app.stdout, replay=True)
+                thread(process.attach, reader, output, replay=True)
                 thread(self._winch, process)
                 exit_code = process.wait()
             signal.signal(signal.SIGWINCH, old_handler)
         else:
-            thread(process.attach, reader, self.app.stdout)
+            t0 = time.time()
+            thread(process.attach, reader, output)
             exit_code = process.wait()
+            if not tty:
+                self._report(received, sent, output.meter,
+                             time.time() - t0)
 
         sys.exit(exit_code)
 
+    def _fan_out(self, options, env, command):
+        """Run the command on several executors concurrently, over the
+        shared HTTP session.  No more executors are used at the same
+        time than there are connection pools (`pool_connections` in
+        the stage config), so that connections are reused rather than
+        evicted.
+
+        :returns: 0 if the command succeeded everywhere, otherwise 1.
+        """
+        if options.tty:
+            sys.exit("cannot use a tty with more than one executor")
+        instances = [d for (k, d) in
+                     self.app.config.service_registry.query_formation(
+                         'executor')]
+        if not instances:
+            sys.exit("no executors")
+        if not options.all_executors:
+            instances = random.sample(
+                instances, min(options.parallel, len(instances)))
+        instances.sort(key=lambda instance: instance['instance'])
+
+        pool_connections = self.app.config.stage_config.pool_connections
+        wanted = min(options.parallel or len(instances), len(instances))
+        max_workers = min(wanted, pool_connections)
+        if wanted > pool_connections:
+            self.log.warning(
+                "running on at most {0} executors at a time; raise "
+                "pool_connections in the stage config to run on more".format(
+                    pool_connections))
+        width = max(len(instance['instance']) for instance in instances)
+        lock = threading.Lock()
+        runner = TaskRunner(max_workers)
+        for instance in instances:
+            output = PrefixWriter(self.app.stdout, '{0} | '.format(
+                instance['instance'].ljust(width)), lock)
+            runner.add(instance['instance'], partial(
+                self._run_on, instance, options, env, command, output))
+
+        failed = 0
+        for name, (exit_code, error) in runner.run().items():
+            if error is not None:
+                status = 'error: {0}'.format(error)
+            else:
+                status = 'exit {0}'.format(exit_code)
+            failed += int(error is not None or exit_code != 0)
+            self.app.stdout.write('{0}: {1}\n'.format(name, status))
+        return 1 if failed else 0
+
+    def _run_on(self, instance, options, env, command, output):
+        """Run the command on a single executor, without input.
+
+        :returns: The exit code and `None`, or `None` and the error
+            that stopped the command.
+        """
+        try:
+            executor = self.app.config.executor(
+                '{0}.api.executor.service'.format(instance['instance']))
+            process = executor.run(
+                self.app.config.formation, options.image,
+                env, command, tty=False)
+            process.wait_for_state('running', 'done', 'error')
+            thread(process.attach, iter(()), output)
+            exit_code = process.wait()
+        except Exception as err:
+            self.log.debug("{0}: {1}".format(instance['instance'], err),
+                           exc_info=True)
+            return None, err
+        finally:
+            output.close()
+        return exit_code, None
+
+    def _bulk_reader(self, options, received, sent):
+        """Return the chunks to send for piped input.  Reading runs
+        ahead of the process by a bounded number of chunks, so that
+        reading and sending overlap while a slow connection holds
+        back reading.
+        """
+        chunks = received.count(read_bulk(self.app.stdin.fileno()))
+        if options.compress:
+            chunks = gzip_chunks(chunks)
+        return prefetch(sent.count(chunks), _BULK_READ_AHEAD)
+
+    def _report(self, received, sent, output, elapsed):
+        message = 'sent {0}'.format(_rate(sent.bytes, elapsed))
+        if sent.bytes != received.bytes:
+            message += ' from {0:.1f} MB of input'.format(
+                received.bytes / 1e6)
+        self.log.info('{0}, received {1}'.format(
+            message, _rate(output.bytes, elapsed)))
+
     def _release(self, options):
         formation = Scheduler(self.app.config.scheduler()).formation(
             self.app.config.formation)
@@ -164,7 +513,7 @@ class Run(Command):
             int(options.release)
         except ValueError:
             with open(options.release) as fp:
-                return yaml.load(fp)
+                return yamlio.load(fp)
         except TypeError:
             return formation.last_release
 
@@ -197,12 +546,34 @@ class Run(Command):
         w, h = terminal_size(self.app.stdin.fileno())
         process.resize_tty(w, h)
 
+    def _listed_containers(self, alt):
+        """Return the number of containers that the client of an
+        executor lists, or `None` if the client cannot list them.
+        """
+        executor = self.app.config.executor(
+            '{0}.api.executor.service'.format(alt['instance']))
+        containers = getattr(executor, 'containers', None)
+        return (float(len(list(containers()))) if containers is not None
+                else None)
+
     def _select_executor(self, options):
-        alts = self.app.config.service_registry.query_formation('executor')
-        if options.executor:
-            for alt in alts:
-                if alt['instance'] == options.executor:
-                    return alt
-            sys.exit("cannot find executor instance %s" % (options.executor,))
-        else:
-            return random.choice([d for (k, d) in alts])
+        # the cached registry answer can be a minute old, so current
+        # loads are asked from the registry itself.
+        registry = (self.app.config.registry_client
+                    if options.placement == 'least-loaded'
+                    else self.app.config.service_registry)
+        alts = [d for (k, d) in registry.query_formation('executor')]
+        if options.placement == 'random':
+            if not alts:
+                sys.exit("no executors")
+            return random.choice(alts)
+        elif options.placement == 'least-loaded':
+            if not alts:
+                sys.exit("no executors")
+            return two_choices(alts, [partial(_announced, 'load'),
+                                      partial(_announced, 'containers'),
+                                      self._listed_containers])
+        for alt in alts:
+            if alt['instance'] == options.placement:
+                return alt
+        sys.exit("cannot find executor instance %s" % (options.placement,))
@@ -35,18 +35,16 @@ from functools import partial
 import os.path
 import os
 import string
-import yaml
 import sys
+import threading
 import time
 import errno
 
-from gilliam.service_registry import ServiceRegistryClient
-from gilliam.service_registry import Resolver
-from gilliam.adapter import ResolveAdapter, WebSocketAdapter
-from gilliam import (BuilderClient, ExecutorClient,
-                     SchedulerClient, RouterClient)
-from requests.adapters import HTTPAdapter
-import requests
+from . import yamlio
+
+# requests, gilliam and the modules that depend on them are imported
+# when first needed, to keep start-up fast for commands that do not
+# talk to the platform.
 
 
 class FormationConfig(object):
@@ -60,15 +58,20 @@ class FormationConfig(object):
 
     def __init__(self, rootdir):
         self.rootdir = rootdir
+        self._files = {}
 
     def _read_file(self, name):
+        if name in self._files:
+            return self._files[name]
         try:
             with open(os.path.join(self.rootdir, '.gilliam', name)) as fp:
-                return fp.read().strip()
+                value = fp.read().strip()
         except EnvironmentError as err:
             if err.errno != errno.ENOENT:
                 raise
-            return None
+            value = None
+        self._files[name] = value
+        return value
 
     def _ensure_dir(self):
         try:
@@ -84,6 +87,7 @@ class FormationConfig(object):
                 fp.write(value)
         except EnvironmentError:
             raise
+        self._files[name] = value.strip()
 
     @classmethod
     def make(cls, rootdir):
@@ -104,6 +108,10 @@ for name in ['stage', 'formation']:
 _RAISE_ERROR = object()
 
 
+def _parse_bool(value):
+    return value.lower() in ('1', 'yes', 'true', 'on')
+
+
 class StageConfig(object):
     """Stage configuration holds information and data about
     installation of Gilliam, such as address to the service registry.
@@ -113,11 +121,56 @@ class StageConfig(object):
     Most configuration variables can be overridden with environment
     variables.  For exammple, to override the `repository` config var,
     set the `GILLIAM_REPOSITORY` variable to the new value.
+
+    `prefetch` is the number of items that listings read ahead in the
+    background while earlier items are being processed, so that the
+    next page of a collection is fetched before it is needed.  Set it
+    to `0` to disable read-ahead.  If `incremental_listings` is set,
+    instances and releases are parsed while they are downloaded rather
+    than a page at a time.
+
+    If `http_cache` is set, responses from the platform are cached in
+    `~/.gilliam/cache/<stage>/http` and revalidated using conditional
+    requests.  The cache is limited to `http_cache_size` bytes.
+
+    The HTTP transport is tuned with `pool_connections` (number of
+    hosts to keep connection pools for), `pool_maxsize` (connections
+    per host; should be at least the number of concurrent requests
+    the client makes), `connect_timeout` and `read_timeout` (seconds,
+    no read timeout by default since build output can be silent for a
+    long time), and `retries` and `retry_backoff` for idempotent
+    requests.  If `compress_min_size` is set, request bodies of at
+    least that many bytes are sent gzip-compressed.
+
+    What `*.service` names resolve to, and the instances of queried
+    formations, are cached in `~/.gilliam/cache/<stage>/resolve.json`
+    for `resolve_ttl` seconds.  Names that fail to resolve are
+    remembered for `resolve_negative_ttl` seconds.  Set `resolve_ttl`
+    to `0` to disable the cache.
+
+    If `service_registry` lists several endpoints, the one with the
+    lowest latency is used, and calls fail over to the others.  An
+    endpoint that fails is avoided for `registry_failure_ttl` seconds,
+    also by later invocations.
     """
 
     __vars__ = (
         ('repository', getpass.getuser(), str),
         ('service_registry', None, partial(string.split, sep=',')),
+        ('prefetch', 200, int),
+        ('incremental_listings', False, _parse_bool),
+        ('http_cache', False, _parse_bool),
+        ('http_cache_size', 50 * 1024 * 1024, int),
+        ('pool_connections', 10, int),
+        ('pool_maxsize', 16, int),
+        ('connect_timeout', 10.0, float),
+        ('read_timeout', None, float),
+        ('retries', 3, int),
+        ('retry_backoff', 0.2, float),
+        ('compress_min_size', None, int),
+        ('resolve_ttl', 60, int),
+        ('resolve_negative_ttl', 10, int),
+        ('registry_failure_ttl', 60, int),
         )
 
     def __init__(self, path):
@@ -160,8 +213,7 @@ class StageConfig(object):
 
         :raises: IOError, OSError
         """
-        with open(self._path) as fp:
-            self._config.update(yaml.load(fp))
+        self._config.update(yamlio.load_file(self._path))
 
     def write(self, path=None):
         """Persist configuration.  `ValueError` will be raised if no
@@ -178,8 +230,8 @@ class StageConfig(object):
         if path is None:
             raise ValueError("path not specified")
         with open(self._path, 'w') as fp:
-            yaml.safe_dump(self._config, fp, encoding='utf-8', tags=None,
-                           default_flow_style=False)
+            yamlio.dump(self._config, fp, encoding='utf-8', tags=None,
+                        default_flow_style=False)
 
     def _override_from_environment(self):
         """Override configuration variables with values from the
@@ -349,8 +401,7 @@ class AuthConfig(object):
         empty, or not there, all credentials will be cleared.
         """
         try:
-            with open(self.path, 'r') as fp:
-                data = yaml.load(fp)
+            data = yamlio.load_file(self.path)
         except EnvironmentError as err:
             if err.errno != errno.ENOENT:
                 raise
@@ -373,7 +424,7 @@ class AuthConfig(object):
                 for registry, cred in self.credentials.items()}
 
         with open(self.path, 'w') as fp:
-            yaml.safe_dump(data, fp, default_flow_style=False)
+            yamlio.dump(data, fp, default_flow_style=False)
         os.chmod(self.path, 0600)
 
     def __enter__(self):
@@ -396,6 +447,15 @@ class AuthConfig(object):
         return ac
 
 
+class Lazy(object):
+    """A `Config` value that is computed by calling `fn` the first
+    time it is used.
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
 class Config(object):
     """The configuration (aka the God object).  Holds all
     configuration more or less, including references to the stage,
@@ -409,52 +469,178 @@ class Config(object):
        >>> router.routes()
        ...
 
+    Any of the configuration values can be given as a `Lazy` value,
+    in which case nothing is read from disk until a command uses it.
+
+    The HTTP session, service registry clients and caches of a stage
+    are kept in `shared`, if given, keyed by the stage and its
+    configuration.  A long-running process (see `gilliam agent`) can
+    pass the same dict to every `Config` it creates so that
+    connections and cached lookups are reused between commands.
     """
 
     def __init__(self, project_dir, stage_config, form_config, auth_config,
-                 stage, formation):
+                 stage, formation, use_cache=True, tracer=None, shared=None):
+        self._values = {}
+        self._lock = threading.RLock()
         self.project_dir = project_dir
         self.stage_config = stage_config
         self.form_config = form_config
         self.auth_config = auth_config
         self.stage = stage
         self.formation = formation
-        self._httpclient = None
-        self._service_registry = None
-        self.scheduler = lambda *a, **kw: SchedulerClient(self.httpclient, *a, **kw)
-        self.executor = lambda *a, **kw: ExecutorClient(self.httpclient, *a, **kw)
-        self.builder = lambda *a, **kw: BuilderClient(self.httpclient, *a, **kw)
-        self.router = lambda *a, **kw: RouterClient(self.httpclient, *a, **kw)
+        self.use_cache = use_cache
+        self.tracer = tracer
+        self._shared = shared
+        self._resources = None
+        self.scheduler = self._scheduler
+        self.executor = partial(self._client, 'ExecutorClient', 'executor')
+        self.builder = partial(self._client, 'BuilderClient', 'builder')
+        self.router = partial(self._client, 'RouterClient', 'router')
+
+    def _traced(self, obj, cat):
+        """Record calls on `obj` if tracing is enabled."""
+        return self.tracer.wrap(obj, cat) if self.tracer else obj
+
+    def _client(self, cls_name, cat, *args, **kwargs):
+        import gilliam
+        return self._traced(getattr(gilliam, cls_name)(
+            self.httpclient, *args, **kwargs), cat)
+
+    def _scheduler(self, *args, **kwargs):
+        import gilliam
+        from .scheduler import StreamingClient
+        return self._traced(StreamingClient(
+            gilliam.SchedulerClient(self.httpclient, *args, **kwargs),
+            incremental=self.stage_config.incremental_listings), 'scheduler')
 
     def _make_httpclient(self):
         if self.stage_config is None:
             raise RuntimeError("need stage config for communication")
-        resolver = Resolver(ServiceRegistryClient(
-                time, self.stage_config.service_registry))
+        from gilliam.adapter import ResolveAdapter, WebSocketAdapter
+        from gilliam.service_registry import Resolver
+        import requests
+        from .httpcache import CacheAdapter, HTTPCache
+        from .registry import CachingResolver, InvalidatingAdapter
+        from .trace import TraceAdapter
+
+        resolver = CachingResolver(Resolver(self.registry_client),
+                                   self.resolution_cache)
+        resolver = self._traced(resolver, 'resolve')
         httpclient = requests.Session()
-        httpclient.mount('http://', ResolveAdapter(HTTPAdapter(), resolver))
+        adapter = ResolveAdapter(InvalidatingAdapter(
+            self._make_http_adapter(), resolver), resolver)
+        if self.use_cache and self.stage_config.http_cache:
+            adapter = CacheAdapter(adapter, HTTPCache(
+                os.path.join(self.cache_dir, 'http'),
+                self.stage_config.http_cache_size))
+        if self.tracer:
+            adapter = TraceAdapter(adapter, self.tracer)
+        httpclient.mount('http://', adapter)
         httpclient.mount('ws://', ResolveAdapter(WebSocketAdapter(), resolver))
         return httpclient
 
+    def _make_http_adapter(self):
+        from .transport import TunedHTTPAdapter, make_retry
+        sc = self.stage_config
+        return TunedHTTPAdapter(
+            timeout=(sc.connect_timeout, sc.read_timeout),
+            compress_min_size=sc.compress_min_size,
+            tracer=self.tracer,
+            pool_connections=sc.pool_connections,
+            pool_maxsize=sc.pool_maxsize,
+            max_retries=make_retry(sc.retries, sc.retry_backoff))
+
     @property
-    def service_registry(self):
+    def cache_dir(self):
+        """Directory where data for the stage is cached."""
+        return os.path.expanduser(os.path.join(
+            '~/.gilliam/cache', self.stage or 'default'))
+
+    def _stage_resources(self):
+        """Return the dict that holds the HTTP session, registry
+        clients and caches of the stage.
+        """
+        if self._resources is None:
+            if self._shared is None or self.tracer is not None:
+                self._resources = {}
+            else:
+                key = repr((self.stage, self.use_cache, sorted(
+                    self.stage_config.items()) if self.stage_config
+                    else None))
+                self._resources = self._shared.setdefault(key, {})
+        return self._resources
+
+    @property
+    def resolution_cache(self):
+        """Cache of service registry lookups, shared between
+        invocations.
+        """
+        resources = self._stage_resources()
+        if 'resolution_cache' not in resources:
+            from .registry import ResolutionCache
+            resources['resolution_cache'] = ResolutionCache(
+                os.path.join(self.cache_dir, 'resolve.json'), time,
+                self.stage_config.resolve_ttl,
+                self.stage_config.resolve_negative_ttl)
+        return resources['resolution_cache']
+
+    @property
+    def registry_client(self):
+        """The client used for all communication with the service
+        registry, both for resolving names and for queries.
+        """
         if self.stage_config is None:
             raise RuntimeError("need stage config for communication")
-        if not self._service_registry:
-            self._service_registry = ServiceRegistryClient(
-                time, self.stage_config.service_registry)
-        return self._service_registry
+        resources = self._stage_resources()
+        if 'registry_client' not in resources:
+            from gilliam.service_registry import ServiceRegistryClient
+            from .registry import EndpointHealth, FailoverRegistryClient
+            client = FailoverRegistryClient(
+                partial(ServiceRegistryClient, time),
+                self.stage_config.service_registry,
+                EndpointHealth(
+                    os.path.join(self.cache_dir, 'registry.json'), time,
+                    failure_ttl=self.stage_config.registry_failure_ttl))
+            resources['registry_client'] = self._traced(client, 'registry')
+        return resources['registry_client']
+
+    @property
+    def service_registry(self):
+        resources = self._stage_resources()
+        if 'service_registry' not in resources:
+            from .registry import CachingRegistry
+            resources['service_registry'] = CachingRegistry(
+                self.registry_client, self.resolution_cache)
+        return resources['service_registry']
 
     @property
     def httpclient(self):
-        if self._httpclient is None:
-            self._httpclient = self._make_httpclient()
-        return self._httpclient
+        resources = self._stage_resources()
+        if 'httpclient' not in resources:
+            resources['httpclient'] = self._make_httpclient()
+        return resources['httpclient']
 
     @classmethod
     def make(cls, project_dir, stage_config, form_config, auth_config,
-             stage, formation):
+             stage, formation, use_cache=True, tracer=None, shared=None):
         return cls(
             project_dir, stage_config, form_config, auth_config,
-            stage, formation
+            stage, formation, use_cache, tracer, shared
             )
+
+
+for name in ['project_dir', 'stage_config', 'form_config', 'auth_config',
+             'stage', 'formation']:
+    def _property(name=name):
+        def getter(self):
+            with self._lock:
+                value = self._values[name]
+                if isinstance(value, Lazy):
+                    value = self._values[name] = value.fn()
+                return value
+
+        def setter(self, value):
+            self._values[name] = value
+        return getter, setter
+    setattr(Config, name, property(*_property()))
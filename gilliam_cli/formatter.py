@@ -75,3 +75,135 @@ class SimpleTableFormatter(ListFormatter, SingleFormatter):
             stdout.write('\n')
 
     emit_one = emit_list
+
+
+class LiveTable(object):
+    """A table that is kept up to date on a terminal.
+
+    Each call to `update` gives the table a new set of rows.  On a TTY
+    only the lines that changed are redrawn, using cursor addressing,
+    and the column given by `highlight` is emphasized for one refresh
+    when its value changes.  If the output is not a TTY, the whole
+    table is written once and after that only new or changed rows,
+    and a line for every row that went away.
+
+    Rows are identified between updates by a key that is given with
+    each row and need not be one of the columns.
+    """
+
+    BOLD = '\033[1m'
+    RESET = '\033[0m'
+    CLEAR_EOL = '\033[K'
+    CLEAR_EOS = '\033[J'
+    CLEAR_SCREEN = '\033[H\033[2J'
+
+    def __init__(self, column_names, stdout, tty, height=None,
+                 highlight=None):
+        self.column_names = column_names
+        self.stdout = stdout
+        self.tty = tty
+        self.height = height
+        self.highlight = (column_names.index(highlight)
+                          if highlight is not None else None)
+        self._widths = None
+        self._rows = None
+        self._keys = None
+        self._lines = []
+        self._emphasized = False
+
+    def _goto(self, lineno):
+        return '\033[{0};1H'.format(lineno + 1)
+
+    def _format(self, row, emphasis=()):
+        cells = []
+        for i, (value, w) in enumerate(zip(row, self._widths)):
+            cell = pad(value, w)
+            if i in emphasis:
+                cell = self.BOLD + cell + self.RESET
+            cells.append(cell)
+        return ' '.join(cells).rstrip()
+
+    def _emphasis(self, key, row, previous):
+        if self.highlight is None or not self.tty:
+            return ()
+        old = previous.get(key)
+        if old is not None and old[self.highlight] != row[self.highlight]:
+            return (self.highlight,)
+        return ()
+
+    def _grow_widths(self, rows):
+        widths = list(self._widths or [len(name) for name in
+                                       self.column_names])
+        for row in rows:
+            for i, value in enumerate(row):
+                widths[i] = max(widths[i], len(value))
+        grown = widths != self._widths
+        self._widths = widths
+        return grown
+
+    def update(self, rows):
+        """Update the table with a new set of rows.
+
+        An update without changes still removes the emphasis from
+        the previous one.
+
+        :param rows: `(key, row)` pairs, in the order to show them.
+        :returns: `True` if anything changed since the last update.
+        """
+        keys = [key for (key, row) in rows]
+        rows = [[str(value) for value in row] for (key, row) in rows]
+        changed = keys != self._keys or rows != self._rows
+        if not changed and not self._emphasized:
+            return False
+
+        first = self._rows is None
+        previous = (dict(zip(self._keys, self._rows))
+                    if changed and not first else {})
+        redraw = self._grow_widths(rows) or first
+
+        emphasis = [self._emphasis(key, row, previous)
+                    for (key, row) in zip(keys, rows)]
+        self._emphasized = any(emphasis)
+        lines = [self._format(self.column_names),
+                 self._format(['-' * w for w in self._widths])]
+        lines.extend(self._format(row, e) for (row, e) in zip(rows, emphasis))
+
+        if not self.tty:
+            if first:
+                self.stdout.write('\n'.join(lines) + '\n')
+            else:
+                for key, row, line in zip(keys, rows, lines[2:]):
+                    if previous.get(key) != row:
+                        self.stdout.write(line + '\n')
+                current = set(keys)
+                for key in self._keys:
+                    if key not in current:
+                        self.stdout.write('{0} removed\n'.format(key))
+        else:
+            if self.height and len(lines) >= self.height:
+                more = len(lines) - self.height + 2
+                lines = lines[:self.height - 2]
+                lines.append('... {0} more'.format(more))
+            if redraw:
+                self.stdout.write(self.CLEAR_SCREEN + '\n'.join(lines)
+                                  + '\n')
+            else:
+                self._patch(lines)
+
+        self.stdout.flush()
+        self._rows = rows
+        self._keys = keys
+        self._lines = lines
+        return changed
+
+    def _patch(self, lines):
+        """Redraw only the lines that differ from what is on screen."""
+        out = []
+        for lineno, line in enumerate(lines):
+            if (lineno >= len(self._lines)
+                    or self._lines[lineno] != line):
+                out.append(self._goto(lineno) + line + self.CLEAR_EOL)
+        if len(lines) < len(self._lines):
+            out.append(self._goto(len(lines)) + self.CLEAR_EOS)
+        out.append(self._goto(len(lines)))
+        self.stdout.write(''.join(out))
@@ -0,0 +1,218 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""On-disk cache for HTTP responses, using conditional requests.
+
+Responses to `GET` requests that carry an `ETag` or `Last-Modified`
+header are stored on disk.  The next time the same resource is
+requested, the request is made conditional with `If-None-Match` and
+`If-Modified-Since`.  If the server answers `304 Not Modified`, the
+cached response is returned in its place.
+
+Streamed responses are stored once the caller has read the whole
+body.
+
+Entries are keyed by the URL and the credentials of the request, so
+that a response is never served to another user, and are only used
+for requests that agree on the headers named by `Vary`.
+"""
+
+from functools import partial
+import cPickle as pickle
+import errno
+import hashlib
+import logging
+import os
+import tempfile
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .util import wrap_content
+
+
+class HTTPCache(object):
+    """A size-bounded store of responses, one file per key.
+
+    The modification time of a file is updated every time the entry
+    is used.  When the total size of the cache exceeds `max_size`
+    bytes, the least recently used entries are evicted.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def _filename(self, key):
+        return os.path.join(self.path, hashlib.md5(key).hexdigest())
+
+    def get(self, key):
+        """Return the cached entry for `key`, or `None`."""
+        fn = self._filename(key)
+        try:
+            with open(fn, 'rb') as fp:
+                entry = pickle.load(fp)
+            os.utime(fn, None)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                self.log.debug("cannot read cache entry: {0}".format(err))
+            return None
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            self.delete(key)
+            return None
+        return entry if entry.get('key') == key else None
+
+    def put(self, key, entry):
+        """Store `entry` for `key`, evicting old entries if needed."""
+        entry = dict(entry, key=key)
+        try:
+            try:
+                os.makedirs(self.path)
+            except EnvironmentError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            fd, tmp = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(entry, fp, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self._filename(key))
+        except EnvironmentError as err:
+            self.log.debug("cannot write cache entry: {0}".format(err))
+            return
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._filename(key))
+        except EnvironmentError:
+            pass
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            fn = os.path.join(self.path, name)
+            try:
+                st = os.stat(fn)
+            except EnvironmentError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+
+        total = sum(size for (mtime, size, fn) in entries)
+        for mtime, size, fn in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(fn)
+            except EnvironmentError:
+                continue
+            total -= size
+
+
+def _vary(headers):
+    """Return the lower-cased header names in the `Vary` header, or
+    `None` if the response varies on something else than headers.
+    """
+    names = [name.strip().lower()
+             for name in headers.get('vary', '').split(',') if name.strip()]
+    return None if '*' in names else names
+
+
+class CacheAdapter(BaseAdapter):
+    """Transport adapter that serves `GET` requests from a `HTTPCache`
+    when the server says that the resource has not been modified.
+    All other requests are passed straight to `adapter`.
+    """
+
+    # Request headers that identify the user.
+    _CREDENTIALS = ('authorization', 'cookie')
+
+    def __init__(self, adapter, cache):
+        super(CacheAdapter, self).__init__()
+        self.adapter = adapter
+        self.cache = cache
+
+    def _cached_response(self, request, url, entry):
+        response = Response()
+        response.status_code = entry['status_code']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['content']
+        response._content_consumed = True
+        response.url = url
+        response.request = request
+        response.connection = self
+        return response
+
+    def _key(self, url, request):
+        credentials = '\0'.join(request.headers.get(name) or ''
+                                for name in self._CREDENTIALS)
+        return '{0} {1}'.format(url, hashlib.sha1(credentials).hexdigest())
+
+    def _request_headers(self, request, names):
+        return {name: request.headers.get(name) for name in names}
+
+    def send(self, request, stream=False, **kwargs):
+        if request.method != 'GET':
+            return self.adapter.send(request, stream=stream, **kwargs)
+
+        # the adapters below rewrite request.url to the resolved
+        # address, so the URL as requested has to be kept.
+        url = request.url
+        key = self._key(url, request)
+        entry = self.cache.get(key)
+        if entry is not None and entry.get('vary') != self._request_headers(
+                request, entry.get('vary', {})):
+            entry = None
+        if entry is not None:
+            if entry['headers'].get('etag'):
+                request.headers['If-None-Match'] = entry['headers']['etag']
+            if entry['headers'].get('last-modified'):
+                request.headers['If-Modified-Since'] = (
+                    entry['headers']['last-modified'])
+
+        response = self.adapter.send(request, stream=stream, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            return self._cached_response(request, url, entry)
+
+        headers = {k.lower(): v for (k, v) in response.headers.items()}
+        vary = _vary(headers)
+        if (response.status_code == 200 and vary is not None
+                and ('etag' in headers or 'last-modified' in headers)):
+            entry = {'status_code': response.status_code,
+                     'reason': response.reason,
+                     'headers': headers,
+                     'vary': self._request_headers(request, vary)}
+            if stream:
+                return wrap_content(response, partial(self._store, key, entry))
+            entry['content'] = response.content
+            self.cache.put(key, entry)
+        return response
+
+    def _store(self, key, entry, chunks):
+        """Store `entry` with the content read from `chunks`, if all
+        of it is read.
+        """
+        content = []
+        for chunk in chunks:
+            content.append(chunk)
+            yield chunk
+        self.cache.put(key, dict(entry, content=''.join(content)))
+
+    def close(self):
+        self.adapter.close()
@@ -0,0 +1,156 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Incremental parsing of collection documents.
+
+A collection is a JSON object with an `items` array and a `links`
+object.  `CollectionParser` yields the elements of `items` as soon as
+they have arrived, so that only one element at a time (plus a chunk of
+input) has to be kept in memory.  Every other member of the object is
+collected and made available when the whole document has been read.
+"""
+
+import json
+import re
+
+
+_WS = re.compile(r'\s*')
+
+# What a number that has been cut off by the end of a chunk can end
+# with, after the part that the decoder accepted.
+_NUMBER_TAIL = re.compile(r'[.eE][-+]?\Z')
+
+
+class CollectionParser(object):
+    """Parse a collection from an iterable of chunks of bytes::
+
+       >>> parser = CollectionParser(response.iter_content(65536))
+       >>> for item in parser.items(member='items'):
+       ...     process(item)
+       >>> parser.document['links']
+
+    Each value is decoded with the C-accelerated decoder of the `json`
+    module; this class only finds where values start and end.
+
+    :raises: `ValueError` if the document is malformed.
+    """
+
+    # Drop consumed input when this many bytes have been consumed.
+    _COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self.document = {}
+
+    def _fill(self):
+        """Read another chunk.  Returns `False` at end of input."""
+        if self._eof:
+            return False
+        if self._pos > self._COMPACT_SIZE:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self._buf += chunk
+                return True
+        self._eof = True
+        return False
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or '' at
+        end of input.
+        """
+        while True:
+            self._pos = _WS.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, chars):
+        c = self._peek()
+        if not c or c not in chars:
+            raise ValueError("expected one of {0!r} at offset {1}, "
+                             "got {2!r}".format(chars, self._pos, c))
+        self._pos += 1
+        return c
+
+    def _truncated(self, value, end):
+        """Return true if `value`, which the decoder stopped reading
+        at `end`, may continue in the next chunk.
+        """
+        if end == len(self._buf):
+            return True
+        return (isinstance(value, (int, long, float))
+                and not isinstance(value, bool)
+                and _NUMBER_TAIL.match(self._buf, end) is not None)
+
+    def _value(self):
+        """Decode the next value.  A value that ends at the end of the
+        buffer, or a number that is followed by the start of a
+        fraction or exponent, may be truncated, so more input is read
+        before it is accepted.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+            if self._truncated(value, end) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+    def _end(self):
+        """Check that only whitespace follows the document."""
+        c = self._peek()
+        if c:
+            raise ValueError("extra data at offset {0}: {1!r}".format(
+                self._pos, c))
+
+    def items(self, member='items'):
+        """Yield the elements of the array `member` as they arrive.
+        When the generator is exhausted, the input has been read to
+        the end and `document` holds every other member of the object.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            self._end()
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key == member:
+                self._expect('[')
+                if self._peek() == ']':
+                    self._pos += 1
+                else:
+                    while True:
+                        yield self._value()
+                        if self._expect(',]') == ']':
+                            break
+                self.document[key] = []
+            else:
+                self.document[key] = self._value()
+            if self._expect(',}') == '}':
+                break
+        self._end()
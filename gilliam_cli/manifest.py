@@ -13,7 +13,8 @@
 # limitations under the License.
 
 import os
-import yaml
+
+from . import yamlio
 
 
 class ProjectManifest(dict):
@@ -30,6 +31,4 @@ class ProjectManifest(dict):
         :returns: The manifest object.
         :raises: OSError, IOError.
         """
-        with open(os.path.join(dir, 'gilliam.yml')) as fp:
-            defn = yaml.load(fp)
-        return cls(defn)
+        return cls(yamlio.load_file(os.path.join(dir, 'gilliam.yml')))
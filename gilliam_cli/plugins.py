@@ -0,0 +1,218 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lazy loading of commands, service plugins and output formatters.
+
+Finding entry points with `pkg_resources` means reading the metadata
+of every installed distribution, which for a short command is most of
+the start-up time.  The entry points of our namespaces are therefore
+kept in an index in `~/.gilliam/cache/entry_points.json` that is
+rebuilt whenever the installed distributions change.  The module of a
+command or plugin is not imported until it is actually used.
+"""
+
+import hashlib
+import importlib
+import logging
+import os
+import sys
+
+from .util import JSONFile
+
+
+_INDEX_PATH = os.path.expanduser('~/.gilliam/cache/entry_points.json')
+
+NAMESPACES = ('gilliam.commands', 'gilliam.services',
+              'cliff.formatter.list', 'cliff.formatter.show')
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except EnvironmentError:
+        return None
+
+
+def _fingerprint():
+    """Identify the installed distributions.  Installing, upgrading
+    or removing a distribution changes a directory on `sys.path`.
+    """
+    digest = hashlib.md5(sys.executable)
+    for entry in sys.path:
+        digest.update('{0}\0{1}\0'.format(entry, _mtime(entry or '.')))
+    return digest.hexdigest()
+
+
+class EntryPoint(object):
+    """An entry point that imports its module when loaded.  Looks
+    enough like `pkg_resources.EntryPoint` for cliff.
+    """
+
+    def __init__(self, name, module_name, attrs):
+        self.name = name
+        self.module_name = module_name
+        self.attrs = attrs
+
+    def load(self, *args, **kwargs):
+        obj = importlib.import_module(self.module_name)
+        for attr in self.attrs:
+            obj = getattr(obj, attr)
+        return obj
+
+
+class _Loaded(object):
+
+    def __init__(self, name, obj):
+        self.name = name
+        self.obj = obj
+
+    def load(self, *args, **kwargs):
+        return self.obj
+
+
+class EntryPointIndex(object):
+    """Index of the entry points in `namespaces`.
+
+    Besides the fingerprint of `sys.path`, the index remembers the
+    `entry_points.txt` files it was built from, so that re-running
+    `setup.py develop` for a changed `setup.py` is noticed too.
+    """
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path=_INDEX_PATH, namespaces=NAMESPACES):
+        self.namespaces = namespaces
+        self._file = JSONFile(path)
+        self._entries = None
+
+    def _valid(self, data):
+        return (data.get('fingerprint') == _fingerprint()
+                and data.get('namespaces') == list(self.namespaces)
+                and all(_mtime(path) == mtime
+                        for (path, mtime) in data['sources']))
+
+    def _scan(self):
+        import pkg_resources
+        entries, sources = {}, set()
+        for namespace in self.namespaces:
+            entries[namespace] = []
+            for ep in pkg_resources.iter_entry_points(namespace):
+                entries[namespace].append(
+                    (ep.name, ep.module_name, list(ep.attrs)))
+                egg_info = getattr(ep.dist, 'egg_info', None)
+                if egg_info:
+                    sources.add(os.path.join(egg_info, 'entry_points.txt'))
+        return {'fingerprint': _fingerprint(),
+                'namespaces': list(self.namespaces),
+                'sources': [(path, _mtime(path)) for path in sorted(sources)],
+                'entries': entries}
+
+    def _load(self):
+        if self._entries is None:
+            data = self._file.load()
+            if not self._valid(data):
+                self.log.debug("rebuilding entry point index")
+                data = self._scan()
+                self._file.save(data)
+            self._entries = data['entries']
+        return self._entries
+
+    def entry_points(self, namespace):
+        """Return the entry points of `namespace`, in the order
+        `pkg_resources` found them.
+        """
+        return [EntryPoint(name, module_name, attrs)
+                for (name, module_name, attrs) in self._load()[namespace]]
+
+
+class CommandManager(object):
+    """Drop-in replacement for `cliff.commandmanager.CommandManager`
+    that reads commands from an `EntryPointIndex`.
+    """
+
+    def __init__(self, namespace, index=None, convert_underscores=True):
+        self.namespace = namespace
+        self.convert_underscores = convert_underscores
+        self.commands = {}
+        self.index = index if index is not None else EntryPointIndex()
+        for ep in self.index.entry_points(namespace):
+            name = (ep.name.replace('_', ' ') if convert_underscores
+                    else ep.name)
+            self.commands[name] = ep
+
+    def __iter__(self):
+        return iter(sorted(self.commands.items()))
+
+    def add_command(self, name, command_class):
+        self.commands[name] = _Loaded(name, command_class)
+
+    def find_command(self, argv):
+        """Given an argument list, find a command and return the
+        processor and any remaining arguments.
+        """
+        search_args = argv[:]
+        name = ''
+        while search_args:
+            if search_args[0].startswith('-'):
+                raise ValueError('Invalid command %r' % search_args[0])
+            next_val = search_args.pop(0)
+            name = '%s %s' % (name, next_val) if name else next_val
+            if name in self.commands:
+                cmd_factory = self.commands[name].load()
+                return (cmd_factory, name, search_args)
+        raise ValueError('Unknown command %r' % (argv,))
+
+
+class _Extension(object):
+    """A plugin that is instantiated the first time `obj` is used."""
+
+    def __init__(self, entry_point):
+        self.name = entry_point.name
+        self.entry_point = entry_point
+        self._obj = None
+
+    @property
+    def plugin(self):
+        return self.entry_point.load()
+
+    @property
+    def obj(self):
+        if self._obj is None:
+            self._obj = self.plugin()
+        return self._obj
+
+
+class ExtensionManager(object):
+    """Stand-in for `stevedore.extension.ExtensionManager` with
+    `invoke_on_load=True`, except that nothing is imported or
+    instantiated until an extension is used.
+    """
+
+    def __init__(self, namespace, index=None):
+        self.namespace = namespace
+        index = index if index is not None else EntryPointIndex()
+        self.extensions = [_Extension(ep)
+                           for ep in index.entry_points(namespace)]
+
+    def __iter__(self):
+        return iter(self.extensions)
+
+    def __getitem__(self, name):
+        for ext in self.extensions:
+            if ext.name == name:
+                return ext
+        raise KeyError(name)
+
+    def names(self):
+        return [ext.name for ext in self.extensions]
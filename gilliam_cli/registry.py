@@ -0,0 +1,365 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Caching of service registry lookups between invocations.
+
+Resolving `*.service` names and querying formations means talking to
+the service registry, which for short commands is most of the work.
+The `ResolutionCache` keeps the answers on disk (per stage) for a
+while, so that the next invocation can skip the registry altogether.
+"""
+
+from functools import partial
+import logging
+import socket
+import threading
+import urlparse
+
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError, RequestException
+
+from .tasks import TaskRunner
+from .util import JSONFile
+
+
+# Errors that make a service registry endpoint count as failed.
+_NETWORK_ERRORS = (RequestException, socket.error, EnvironmentError)
+
+
+class UnresolvableError(Exception):
+    """Raised when a name recently failed to resolve."""
+
+
+class ResolutionCache(object):
+    """Entries with a time-to-live, persisted as a JSON file.
+
+    :param path: Where the cache is stored.
+    :param clock: Something with a `time` method.
+    :param ttl: Seconds that a successful lookup is kept.
+    :param negative_ttl: Seconds that a failed lookup is kept.
+    """
+
+    def __init__(self, path, clock, ttl, negative_ttl):
+        self.clock = clock
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._file = JSONFile(path)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._file.load()
+
+    def _save(self):
+        self._file.save(self._entries)
+
+    def get(self, key):
+        """Return `(found, value)` for `key`.  A negative entry has
+        the value `None`.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < self.clock.time():
+                del self._entries[key]
+                return False, None
+            return True, value
+
+    def put(self, key, value):
+        """Store `value` under `key`.  A value of `None` is a negative
+        entry and is kept for `negative_ttl` seconds.
+        """
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if not ttl:
+            return
+        with self._lock:
+            self._load()
+            self._entries[key] = (self.clock.time() + ttl, value)
+            self._save()
+
+    def invalidate(self, predicate):
+        """Drop every entry for which `predicate(key, value)` is true."""
+        with self._lock:
+            self._load()
+            stale = [key for (key, (expires, value)) in self._entries.items()
+                     if predicate(key, value)]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._save()
+
+
+def _replace_netloc(url, netloc):
+    parts = urlparse.urlsplit(url)
+    return urlparse.urlunsplit(parts._replace(netloc=netloc))
+
+
+class CachingResolver(object):
+    """Wraps a `Resolver` and caches what `*.service` host names
+    resolve to.  Everything else is delegated to the wrapped resolver.
+    """
+
+    def __init__(self, resolver, cache):
+        self.resolver = resolver
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.resolver, name)
+
+    def resolve_url(self, url):
+        netloc = urlparse.urlsplit(url).netloc
+        if not netloc.split(':', 1)[0].endswith('.service'):
+            return self.resolver.resolve_url(url)
+
+        key = 'host:' + netloc
+        found, resolved = self.cache.get(key)
+        if found and resolved is None:
+            raise UnresolvableError("{0}: cannot resolve".format(netloc))
+        if not found:
+            try:
+                resolved = urlparse.urlsplit(self.resolver.resolve_url(
+                    _replace_netloc(url, netloc))).netloc
+            except Exception:
+                self.cache.put(key, None)
+                raise
+            self.cache.put(key, resolved)
+        return _replace_netloc(url, resolved)
+
+    def invalidate(self, netloc):
+        """Forget every name that resolved to `netloc`, and all cached
+        formation queries.
+        """
+        self.cache.invalidate(lambda key, value: (
+            key.startswith('formation:') or value == netloc))
+
+
+class InvalidatingAdapter(BaseAdapter):
+    """Transport adapter that tells `resolver` to forget about an
+    endpoint when a connection to it cannot be established.
+    """
+
+    def __init__(self, adapter, resolver):
+        super(InvalidatingAdapter, self).__init__()
+        self.adapter = adapter
+        self.resolver = resolver
+
+    def send(self, request, **kwargs):
+        try:
+            return self.adapter.send(request, **kwargs)
+        except ConnectionError:
+            self.resolver.invalidate(urlparse.urlsplit(request.url).netloc)
+            raise
+
+    def close(self):
+        self.adapter.close()
+
+
+class CachingRegistry(object):
+    """Wraps a `ServiceRegistryClient` and caches formation queries.
+    Everything else is delegated to the wrapped client.
+    """
+
+    def __init__(self, client, cache):
+        self.client = client
+        self.cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def query_formation(self, formation):
+        key = 'formation:' + formation
+        found, result = self.cache.get(key)
+        if not found:
+            result = list(self.client.query_formation(formation))
+            self.cache.put(key, result)
+        return result
+
+
+def _endpoint_address(endpoint):
+    """Return `(host, port)` for a registry endpoint, or `None` if it
+    does not name a port.
+    """
+    netloc = (urlparse.urlsplit(endpoint).netloc if '://' in endpoint
+              else endpoint)
+    host, sep, port = netloc.rpartition(':')
+    if not sep or not port.isdigit():
+        return None
+    return host, int(port)
+
+
+class EndpointHealth(object):
+    """Latency and failures of service registry endpoints, persisted
+    as a JSON file so that later invocations can avoid dead endpoints
+    right away.
+
+    :param failure_ttl: Seconds that an endpoint is avoided after it
+        failed.
+    :param probe_ttl: Seconds that a measured latency is trusted
+        before the endpoints are probed again.
+    """
+
+    log = logging.getLogger(__name__)
+
+    # Weight of a new latency sample.
+    _ALPHA = 0.3
+
+    def __init__(self, path, clock, failure_ttl=60, probe_ttl=600,
+                 probe_timeout=1.0):
+        self.clock = clock
+        self.failure_ttl = failure_ttl
+        self.probe_ttl = probe_ttl
+        self.probe_timeout = probe_timeout
+        self._file = JSONFile(path)
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _entry(self, endpoint):
+        if self._entries is None:
+            self._entries = self._file.load()
+        entry = self._entries.setdefault(endpoint, {
+            'latency': None, 'measured_at': 0, 'failed_at': 0})
+        entry.setdefault('saved_at', entry['measured_at'])
+        return entry
+
+    def _failed(self, entry, now):
+        return entry['failed_at'] + self.failure_ttl > now
+
+    def order(self, endpoints):
+        """Return `endpoints` with the healthy ones first, lowest
+        latency first.  Endpoints that recently failed come last.
+        """
+        now = self.clock.time()
+        entries = self._snapshot(endpoints)
+        stale = [e for e in endpoints
+                 if entries[e]['measured_at'] + self.probe_ttl < now
+                 and not self._failed(entries[e], now)]
+        if len(endpoints) > 1 and stale:
+            self.probe(stale)
+            entries = self._snapshot(endpoints)
+
+        def key(endpoint):
+            entry = entries[endpoint]
+            latency = entry['latency']
+            return (self._failed(entry, now), latency is None, latency)
+        return sorted(endpoints, key=key)
+
+    def _snapshot(self, endpoints):
+        """Return a copy of the entries of `endpoints`."""
+        with self._lock:
+            return {e: dict(self._entry(e)) for e in endpoints}
+
+    def probe(self, endpoints):
+        """Measure the time it takes to connect to each endpoint.
+        Endpoints are probed concurrently.
+        """
+        def _probe(endpoint):
+            address = _endpoint_address(endpoint)
+            if address is None:
+                return
+            t0 = self.clock.time()
+            try:
+                socket.create_connection(address, self.probe_timeout).close()
+            except (socket.error, EnvironmentError):
+                self.failure(endpoint)
+            else:
+                self.success(endpoint, self.clock.time() - t0)
+
+        runner = TaskRunner()
+        for endpoint in endpoints:
+            runner.add(endpoint, partial(_probe, endpoint))
+        runner.run()
+
+    def success(self, endpoint, latency):
+        """Record a successful call taking `latency` seconds.  The file
+        is only written if the endpoint recovers from a failure, had
+        no latency yet, or was saved more than half `probe_ttl` ago
+        (so that later invocations do not probe it needlessly).
+        """
+        now = self.clock.time()
+        with self._lock:
+            entry = self._entry(endpoint)
+            changed = (entry['latency'] is None or entry['failed_at']
+                       or entry['saved_at'] + self.probe_ttl / 2.0 < now)
+            if entry['latency'] is None:
+                entry['latency'] = latency
+            else:
+                entry['latency'] += self._ALPHA * (latency - entry['latency'])
+            entry['measured_at'] = now
+            entry['failed_at'] = 0
+            if changed:
+                self._save(now)
+
+    def failure(self, endpoint):
+        """Record that `endpoint` failed."""
+        self.log.debug("service registry {0} failed".format(endpoint))
+        now = self.clock.time()
+        with self._lock:
+            entry = self._entry(endpoint)
+            changed = not self._failed(entry, now)
+            entry['failed_at'] = now
+            if changed:
+                self._save(now)
+
+    def _save(self, now):
+        """Write the entries; call with the lock held."""
+        for entry in self._entries.values():
+            entry['saved_at'] = now
+        self._file.save(self._entries)
+
+
+class FailoverRegistryClient(object):
+    """A service registry client that spreads over several endpoints.
+
+    Calls go to the healthiest endpoint first (see `EndpointHealth`).
+    If the call fails with a network error, the endpoint is marked as
+    failed and the call is retried on the next endpoint.  Results that
+    are iterators are returned as lists.
+
+    :param factory: Called with a list of endpoints to create the
+        underlying client for an endpoint.
+    """
+
+    def __init__(self, factory, endpoints, health):
+        self.endpoints = list(endpoints)
+        self.health = health
+        self._clients = {e: factory([e]) for e in self.endpoints}
+
+    def _call(self, name, *args, **kwargs):
+        endpoints = self.health.order(self.endpoints)
+        for n, endpoint in enumerate(endpoints):
+            t0 = self.health.clock.time()
+            try:
+                result = getattr(self._clients[endpoint], name)(
+                    *args, **kwargs)
+                # read results that are generators (such as those of
+                # query_formation) here, so that their errors fail
+                # over too.
+                if hasattr(result, 'next') and iter(result) is result:
+                    result = list(result)
+            except _NETWORK_ERRORS:
+                self.health.failure(endpoint)
+                if n == len(endpoints) - 1:
+                    raise
+            else:
+                self.health.success(endpoint, self.health.clock.time() - t0)
+                return result
+
+    def __getattr__(self, name):
+        if not callable(getattr(self._clients[self.endpoints[0]], name)):
+            return getattr(self._clients[self.endpoints[0]], name)
+        return partial(self._call, name)
@@ -0,0 +1,362 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Match URLs against a route table without asking the router.
+
+Domains and paths of routes are templates where `{name}` matches one
+label of the domain or one segment of the path, and `{name:REGEX}`
+matches `REGEX`.  A route without a domain matches every domain.  The
+whole domain and the whole path have to match.
+
+When several routes match a URL, routes with a domain are preferred
+over routes without one, then routes with a longer literal path
+prefix, then the route that comes first in the table.
+
+Routes are indexed in a trie keyed by the literal labels at the end
+of the domain, in which every node holds a trie keyed by the literal
+segments at the start of the path.  Only the routes found along the
+way are tried, so a lookup does not depend on the size of the table
+but on how many routes share a prefix.
+"""
+
+from urlparse import urlsplit
+import re
+
+
+_DEFAULT_DOMAIN_REGEX = '[^.]+'
+_DEFAULT_PATH_REGEX = '[^/]+'
+
+# Tried, in order, as the value of a variable when making up a URL
+# that a route matches.
+_SAMPLES = ('x', '0', 'x/x', 'x.x', '')
+
+_TARGET_VARIABLE = re.compile(r'\{(\w+)\}')
+
+
+def split_template(template):
+    """Split `template` into literal text and variables.
+
+    :returns: A list of strings (literal text) and `(name, regex)`
+        tuples, where `regex` is `None` if not given.
+    :raises: ValueError if a variable is not closed.
+    """
+    parts, literal, pos = [], [], 0
+    while pos < len(template):
+        c = template[pos]
+        if c != '{':
+            literal.append(c)
+            pos += 1
+            continue
+        depth, end = 1, pos + 1
+        while end < len(template) and depth:
+            depth += {'{': 1, '}': -1}.get(template[end], 0)
+            end += 1
+        if depth:
+            raise ValueError("{0}: unclosed variable".format(template))
+        if literal:
+            parts.append(''.join(literal))
+            literal = []
+        name, _, regex = template[pos + 1:end - 1].partition(':')
+        parts.append((name, regex or None))
+        pos = end
+    if literal:
+        parts.append(''.join(literal))
+    return parts
+
+
+def compile_template(template, default_regex, flags=0):
+    """Compile `template` to a regular expression that matches all of
+    a string.  Values of variables are available as named groups.
+
+    :raises: ValueError if the template is invalid.
+    """
+    pattern, seen = [], set()
+    for part in split_template(template):
+        if not isinstance(part, tuple):
+            pattern.append(re.escape(part))
+            continue
+        name, regex = part
+        regex = regex or default_regex
+        if re.match(r'^[A-Za-z_]\w*$', name) and name not in seen:
+            seen.add(name)
+            pattern.append('(?P<{0}>{1})'.format(name, regex))
+        else:
+            pattern.append('(?:{0})'.format(regex))
+    try:
+        return re.compile(''.join(pattern) + r'\Z', flags)
+    except re.error as err:
+        raise ValueError("{0}: {1}".format(template, err))
+
+
+def _literal_prefix(template):
+    parts = split_template(template)
+    return parts[0] if parts and not isinstance(parts[0], tuple) else ''
+
+
+def _domain_keys(domain):
+    """Return the literal labels at the end of `domain`, last first."""
+    keys = []
+    for label in reversed(domain.lower().split('.')):
+        if '{' in label or '}' in label:
+            break
+        keys.append(label)
+    return keys
+
+
+def _path_keys(path):
+    """Return the literal segments at the start of `path` that are
+    followed by a slash.
+    """
+    segments = _literal_prefix(path).split('/')
+    return segments[:-1]
+
+
+def _example(template, default_regex):
+    """Make up a string that `template` matches, or return `None`."""
+    out = []
+    for part in split_template(template):
+        if not isinstance(part, tuple):
+            out.append(part)
+            continue
+        try:
+            regex = re.compile('(?:{0})\\Z'.format(part[1] or default_regex))
+        except re.error:
+            return None
+        for sample in _SAMPLES:
+            if regex.match(sample):
+                out.append(sample)
+                break
+        else:
+            return None
+    return ''.join(out)
+
+
+def split_url(url):
+    """Split `url` into host and path.  The scheme is optional; a URL
+    that starts with a slash has no host.
+    """
+    if not url.startswith('/') and '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    return (parts.hostname or None), (parts.path or '/')
+
+
+class CompiledRoute(object):
+    """A route of the route table.  Its templates are compiled the
+    first time the route is tried, so that building an index of a
+    large table is cheap.
+    """
+
+    def __init__(self, route, order):
+        self.route = route
+        self.order = order
+        self.domain = route.get('domain') or None
+        self.path = route['path']
+        self.priority = (self.domain is None,
+                         -len(_literal_prefix(self.path)), order)
+        self._regexes = None
+
+    def _compile(self):
+        if self._regexes is None:
+            self._regexes = (
+                compile_template(self.domain, _DEFAULT_DOMAIN_REGEX, re.I)
+                if self.domain else None,
+                compile_template(self.path, _DEFAULT_PATH_REGEX))
+        return self._regexes
+
+    @property
+    def name(self):
+        return self.route.get('name')
+
+    def match(self, host, path):
+        """Return the values of the variables if the route matches,
+        otherwise `None`.
+
+        :raises: ValueError if the route has an invalid template.
+        """
+        domain_regex, path_regex = self._compile()
+        variables = {}
+        if domain_regex is not None:
+            m = domain_regex.match(host or '')
+            if m is None:
+                return None
+            variables.update(m.groupdict())
+        m = path_regex.match(path)
+        if m is None:
+            return None
+        variables.update(m.groupdict())
+        return variables
+
+    def rewrite(self, variables):
+        """Return the target with `variables` filled in."""
+        return _TARGET_VARIABLE.sub(
+            lambda m: variables.get(m.group(1), m.group(0)),
+            self.route['target'])
+
+    def example(self):
+        """Return a `(host, path)` that this route matches, or `None`
+        if one cannot be made up.
+        """
+        host = (_example(self.domain, _DEFAULT_DOMAIN_REGEX)
+                if self.domain else 'example.com')
+        path = _example(self.path, _DEFAULT_PATH_REGEX)
+        if host is None or path is None or self.match(host, path) is None:
+            return None
+        return host, path
+
+
+class _Node(object):
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        self.values = []
+
+
+class _Trie(object):
+
+    def __init__(self):
+        self.root = _Node()
+
+    def node(self, keys):
+        """Return the node at `keys`, creating it if needed."""
+        node = self.root
+        for key in keys:
+            node = node.children.get(key) or node.children.setdefault(
+                key, _Node())
+        return node
+
+    def walk(self, keys):
+        """Yield the values of the nodes on the way to `keys`."""
+        node = self.root
+        for value in node.values:
+            yield value
+        for key in keys:
+            node = node.children.get(key)
+            if node is None:
+                break
+            for value in node.values:
+                yield value
+
+
+class RouteIndex(object):
+    """Index of a route table, for matching URLs against it.
+
+    :param routes: Routes as returned by the router: dicts with
+        `name`, `domain`, `path` and `target`.
+
+    Lookups raise `ValueError` if they come across a route with an
+    invalid template.
+    """
+
+    def __init__(self, routes):
+        self.routes = []
+        self._domains = _Trie()
+        for order, route in enumerate(routes):
+            compiled = CompiledRoute(route, order)
+            self.routes.append(compiled)
+            node = self._domains.node(
+                _domain_keys(compiled.domain) if compiled.domain else ())
+            if not node.values:
+                node.values.append(_Trie())
+            node.values[0].node(_path_keys(compiled.path)).values.append(
+                compiled)
+
+    def candidates(self, host, path):
+        """Return the routes that may match, best first."""
+        host_keys = reversed(host.lower().split('.')) if host else ()
+        path_keys = path.split('/')
+        found = [route for paths in self._domains.walk(host_keys)
+                 for route in paths.walk(path_keys)]
+        found.sort(key=lambda route: route.priority)
+        return found
+
+    def match_all(self, host, path):
+        """Return `(route, variables)` for every route that matches,
+        best first.
+        """
+        matches = []
+        for route in self.candidates(host, path):
+            variables = route.match(host, path)
+            if variables is not None:
+                matches.append((route, variables))
+        return matches
+
+    def match(self, host, path):
+        """Return `(route, variables)` for the route that a request
+        for `path` on `host` takes, or `None`.
+        """
+        for route in self.candidates(host, path):
+            variables = route.match(host, path)
+            if variables is not None:
+                return route, variables
+        return None
+
+    def _example_hosts(self):
+        """Return a trie, keyed like the paths, of the hosts made up
+        for the domain routes of the table.
+        """
+        hosts = _Trie()
+        for route in self.routes:
+            if route.domain:
+                host = _example(route.domain, _DEFAULT_DOMAIN_REGEX)
+                if host is not None:
+                    hosts.node(_path_keys(route.path)).values.append(host)
+        return hosts
+
+    def conflicts(self):
+        """Find routes that get requests meant for other routes.
+
+        For every route a URL that it matches is made up, on its own
+        domain and on the domains of other routes that could take the
+        same path, as far as the route matches those too (always, for
+        a route without a domain).  If
+        another route also matches such a URL, the two routes
+        overlap; if the other route is preferred, the route is
+        shadowed for that URL.  Each other route is reported once,
+        as shadowing if it does so on any of the hosts.
+
+        Only one path is made up per route, so routes that only
+        conflict on other paths are not found.
+
+        :returns: `(route, other, shadowed, url)` tuples.
+        """
+        hosts = self._example_hosts()
+        for route in self.routes:
+            example = route.example()
+            if example is None:
+                continue
+            host, path = example
+            found, others = {}, []
+            # only the hosts of routes that the path can take can
+            # make a difference.
+            near = set(hosts.walk(path.split('/')))
+            near.discard(host)
+            for h in [host] + sorted(near):
+                if h != host and route.match(h, path) is None:
+                    continue
+                url = '{0}{1}'.format(
+                    h if route.domain or h != host else '', path)
+                for other, _ in self.match_all(h, path):
+                    if other is route:
+                        continue
+                    shadowed = other.priority < route.priority
+                    if other not in found:
+                        others.append(other)
+                    elif found[other][0] or not shadowed:
+                        continue
+                    found[other] = (shadowed, url)
+            for other in others:
+                shadowed, url = found[other]
+                yield route, other, shadowed, url
@@ -15,9 +15,18 @@
 """High-level interface for the scheduler."""
 
 import getpass
+import logging
 import time
+import urllib
 
 from gilliam.errors import ConflictError
+from requests import HTTPError
+
+from .util import traverse_collection
+
+
+# Marker for "fetch the last release from the scheduler".
+_FETCH = object()
 
 
 def _merge_service_env(base, services):
@@ -28,7 +37,7 @@ def _merge_service_env(base, services):
     for name, defn in result.items():
         env = defn.get('env', {})
         val = base.get(name, {}).get('env', {})
-        env.update({k: v for (k, v) in val if k not in env})
+        env.update({k: v for (k, v) in val.items() if k not in env})
     return result
 
 
@@ -49,15 +58,42 @@ class Formation(object):
         releases.sort(key=lambda release: int(release['name']))
         return releases[-1]
 
+    def instances(self, **filters):
+        """Iterate over instances in the formation.
+
+        Each keyword argument names an instance field and gives a
+        sequence of accepted values; only instances that match all
+        filters are yielded.  The scheduler has no query parameters
+        for this, so the filters are applied here while the instances
+        stream in.
+        """
+        filters = {name: list(values) for (name, values) in filters.items()
+                   if values}
+        for instance in self.client.instances(self.formation):
+            if all(instance.get(name) in values
+                   for (name, values) in filters.items()):
+                yield instance
+
     def find_release(self, name):
         for release in self.client.releases(self.formation):
             if release['name'] == name:
                 return release
         return None
 
-    def release(self, author, message, services, merge_env=True):
+    def release(self, author, message, services, merge_env=True,
+                current=_FETCH):
+        """Create a new release.
+
+        :param current: (Optional) The last release, if the caller
+            already has it at hand.  It is only used for the first
+            attempt; if someone else creates a release in the
+            meantime the last release is fetched again.
+
+        :returns: Name of the new release.
+        """
         while True:
-            current = self.last_release
+            if current is _FETCH:
+                current = self.last_release
             try:
                 response = self.client.create_release(
                     self.formation, self._name_release(current),
@@ -66,7 +102,7 @@ class Formation(object):
                     if (merge_env and current) else services
                     )
             except ConflictError:
-                continue
+                current = _FETCH
             else:
                 return response['name']
 
@@ -88,6 +124,67 @@ class Formation(object):
                 time.sleep(rate)
 
 
+class StreamingClient(object):
+    """Wraps a scheduler client so that, if `incremental` is true, the
+    instance and release collections are parsed while they are
+    downloaded, instead of a page at a time.  Memory use is then
+    independent of the page size.
+
+    The collections are read from `/formation/<name>/instances` and
+    `/formation/<name>/releases` on the `host` of the client, using
+    its `httpclient`.  If the client does not expose those, or the
+    first page cannot be read from there, the calls are passed
+    through.  Every other method is passed through to `client`.
+    """
+
+    log = logging.getLogger(__name__)
+
+    _PATHS = {'instances': '/formation/{0}/instances',
+              'releases': '/formation/{0}/releases'}
+
+    def __init__(self, client, incremental=False):
+        self.client = client
+        self.incremental = incremental
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _collection(self, name, formation):
+        httpclient = getattr(self.client, 'httpclient', None)
+        host = getattr(self.client, 'host', None)
+        if not self.incremental or httpclient is None or host is None:
+            return None
+        return traverse_collection(
+            httpclient, 'http://{0}{1}'.format(host, self._PATHS[name].format(
+                urllib.quote(formation, safe=''))),
+            incremental=True)
+
+    def _iterate(self, name, formation):
+        fallback = getattr(self.client, name)
+        items = self._collection(name, formation)
+        if items is not None:
+            try:
+                first = next(items)
+            except StopIteration:
+                return
+            except (HTTPError, ValueError) as err:
+                self.log.debug("cannot stream {0}, falling back: {1}".format(
+                    name, err))
+            else:
+                yield first
+                for item in items:
+                    yield item
+                return
+        for item in fallback(formation):
+            yield item
+
+    def instances(self, formation):
+        return self._iterate('instances', formation)
+
+    def releases(self, formation):
+        return self._iterate('releases', formation)
+
+
 class Scheduler(object):
 
     def __init__(self, client):
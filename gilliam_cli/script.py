@@ -17,10 +17,10 @@ import os
 import sys
 
 from cliff.app import App
-from cliff.commandmanager import CommandManager
-from stevedore.extension import ExtensionManager
 
-from .config import Config, StageConfig, FormationConfig, AuthConfig
+from .config import (AuthConfig, Config, FormationConfig, Lazy,
+                     StageConfig)
+from .plugins import CommandManager, EntryPointIndex, ExtensionManager
 from . import util
 
 
@@ -29,49 +29,70 @@ class GilliamApp(App):
 
     log = logging.getLogger(__name__)
 
-    def __init__(self, command_manager, service_manager):
+    def __init__(self, command_manager, service_manager, stdin=None,
+                 stdout=None, stderr=None, shared=None):
         super(GilliamApp, self).__init__(
             description='gilliam X', version='0.1',
-            command_manager=command_manager)
+            command_manager=command_manager,
+            stdin=stdin, stdout=stdout, stderr=stderr)
         self.service_manager = service_manager
+        self.shared = shared
 
     def initialize_app(self, argv):
-        """Initialize app before command is run."""
-
-        # we do not require anything for the help command to run.
-        if argv and argv[0] == 'help':
-            return
-
-        project_dir = self.options.project_dir or util.find_rootdir()
-
-        form_config = (
-            FormationConfig.make(project_dir) if project_dir else
-            None)
-
-        env_stage = os.getenv('GILLIAM_STAGE')
-        self.options.stage = (
-            self.options.stage if self.options.stage else
-            form_config.stage if form_config else
-            env_stage if env_stage else
-            None)
-        self.options.formation = (
-            self.options.formation if self.options.formation else
-            form_config.formation if form_config else
-            None)
-
-        try:
-            stage_config = (
-                StageConfig.make(self.options.stage) if self.options.stage else
-                StageConfig.default())
-        except EnvironmentError as err:
-            stage_config = None
-
-        auth_path = os.path.expanduser('~/.gilliam/auth')
-        auth_config = AuthConfig.make(auth_path)
+        """Initialize app before command is run.
+
+        Nothing is read from disk here; the project directory and the
+        formation, stage and auth configurations are read the first
+        time they are used, normally when `prepare_to_run_command`
+        checks what the command requires.
+        """
+        options = self.options
+
+        def _project_dir():
+            return options.project_dir or util.find_rootdir()
+
+        def _form_config():
+            project_dir = self.config.project_dir
+            return FormationConfig.make(project_dir) if project_dir else None
+
+        def _stage():
+            form_config = self.config.form_config
+            env_stage = os.getenv('GILLIAM_STAGE')
+            return (
+                options.stage if options.stage else
+                form_config.stage if form_config else
+                env_stage if env_stage else
+                None)
+
+        def _formation():
+            form_config = self.config.form_config
+            return (
+                options.formation if options.formation else
+                form_config.formation if form_config else
+                None)
+
+        def _stage_config():
+            stage = self.config.stage
+            try:
+                return (StageConfig.make(stage) if stage else
+                        StageConfig.default())
+            except EnvironmentError as err:
+                return None
+
+        def _auth_config():
+            auth_path = os.path.expanduser('~/.gilliam/auth')
+            return AuthConfig.make(auth_path)
+
+        tracer = None
+        if options.trace:
+            from .trace import Tracer
+            tracer = Tracer()
 
         self.config = Config(
-            project_dir, stage_config, form_config, auth_config,
-            self.options.stage, self.options.formation)
+            Lazy(_project_dir), Lazy(_stage_config), Lazy(_form_config),
+            Lazy(_auth_config), Lazy(_stage), Lazy(_formation),
+            use_cache=options.use_cache,
+            tracer=tracer, shared=self.shared)
 
     def configure_logging(self):
         super(GilliamApp, self).configure_logging()
@@ -104,6 +125,19 @@ class GilliamApp(App):
             dest="project_dir",
             help="root directory of your project")
 
+        parser.add_argument(
+            '--no-cache',
+            action='store_false',
+            dest='use_cache',
+            default=True,
+            help="do not use the HTTP cache")
+
+        parser.add_argument(
+            '--trace',
+            metavar='FILE',
+            dest='trace',
+            help="write a Chrome trace of requests and calls to FILE")
+
         return parser
 
     def prepare_to_run_command(self, cmd):
@@ -122,9 +156,14 @@ class GilliamApp(App):
             if not self.config.stage_config:
                 sys.exit("no stage")
 
+    def clean_up(self, cmd, result, err):
+        config = getattr(self, 'config', None)
+        if config is not None and config.tracer is not None:
+            config.tracer.write(self.options.trace)
+
 
 def main(argv=sys.argv[1:]):
-    myapp = GilliamApp(CommandManager('gilliam.commands'),
-                       ExtensionManager('gilliam.services',
-                                        invoke_on_load=True))
+    index = EntryPointIndex()
+    myapp = GilliamApp(CommandManager('gilliam.commands', index),
+                       ExtensionManager('gilliam.services', index))
     return myapp.run(argv)
@@ -0,0 +1,126 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run independent pieces of work concurrently."""
+
+from collections import OrderedDict
+import logging
+import sys
+import threading
+import time
+
+
+class TaskRunner(object):
+    """Run a set of tasks, where a task may require the results of
+    other tasks.  Tasks that do not depend on each other are run
+    concurrently, each in its own thread::
+
+       >>> runner = TaskRunner()
+       >>> runner.add('manifest', load_manifest)
+       >>> runner.add('release', fetch_last_release)
+       >>> runner.add('services', build_services, requires=('manifest',))
+       >>> results = runner.run()
+
+    A task is called with the results of the tasks it requires as
+    positional arguments, in the order they were given.
+
+    If a task fails no more tasks are started.  Tasks that are already
+    running are allowed to finish, after which the first error is
+    re-raised in the calling thread.
+
+    :param max_workers: (Optional) The most tasks to run at the same
+        time.
+    """
+
+    log = logging.getLogger(__name__)
+
+    # How often the calling thread wakes up while waiting; keeps it
+    # responsive to KeyboardInterrupt.
+    _POLL_INTERVAL = 0.5
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._tasks = OrderedDict()
+
+    def add(self, name, fn, requires=()):
+        """Add a task.
+
+        :param name: Name of the task.  Must be unique.
+        :param fn: Callable that performs the work.
+        :param requires: Names of tasks whose results `fn` requires.
+            They must already have been added.
+
+        :raises: `ValueError` if the name is taken or if a required
+            task is unknown.
+        """
+        if name in self._tasks:
+            raise ValueError("{0}: task already added".format(name))
+        for required in requires:
+            if required not in self._tasks:
+                raise ValueError("{0}: unknown task {1}".format(
+                    name, required))
+        self._tasks[name] = (fn, tuple(requires))
+
+    def run(self):
+        """Run all tasks and wait for them to finish.
+
+        :returns: Results of all tasks, in the order they were added.
+        :rtype: OrderedDict.
+        """
+        cond = threading.Condition()
+        results, running, failures = {}, set(), []
+        pending = list(self._tasks)
+
+        def _work(name, fn, args):
+            t0 = time.time()
+            try:
+                value = fn(*args)
+            except BaseException:
+                exc_info = sys.exc_info()
+            else:
+                exc_info = None
+            self.log.debug("task {0} done (time {1:.3f}s)".format(
+                name, time.time() - t0))
+            with cond:
+                running.discard(name)
+                if exc_info is not None:
+                    failures.append(exc_info)
+                else:
+                    results[name] = value
+                cond.notify()
+
+        with cond:
+            while True:
+                if not failures:
+                    for name in list(pending):
+                        if (self.max_workers is not None
+                                and len(running) >= self.max_workers):
+                            break
+                        fn, requires = self._tasks[name]
+                        if all(r in results for r in requires):
+                            pending.remove(name)
+                            running.add(name)
+                            t = threading.Thread(target=_work, args=(
+                                name, fn, [results[r] for r in requires]))
+                            t.daemon = True
+                            t.start()
+                if not running:
+                    break
+                cond.wait(self._POLL_INTERVAL)
+
+        if failures:
+            exc_type, exc_value, tb = failures[0]
+            raise exc_type, exc_value, tb
+
+        return OrderedDict((name, results[name]) for name in self._tasks)
@@ -0,0 +1,179 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record where time goes, in the Chrome trace event format.
+
+The file written by `Tracer.write` can be loaded into
+`chrome://tracing` (or https://ui.perfetto.dev).  Spans are recorded
+for service registry resolution, TCP connects, requests (up to the
+response headers), response bodies and calls on the platform
+clients.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+import json
+import os
+import threading
+import time
+import types
+
+from requests.adapters import BaseAdapter
+
+from .util import wrap_content
+
+
+class Tracer(object):
+    """Collects spans from any thread."""
+
+    def __init__(self, clock=time):
+        self.clock = clock
+        self._events = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _now(self):
+        return int(self.clock.time() * 1e6)
+
+    def add(self, name, cat, start, end, args=None):
+        """Record a span from `start` to `end` (in microseconds)."""
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'ts': start,
+                 'dur': end - start, 'pid': self._pid,
+                 'tid': threading.current_thread().ident}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name, cat, **args):
+        """Record the time spent in the block.  The yielded dict can
+        be used to add arguments to the span.
+        """
+        start = self._now()
+        try:
+            yield args
+        finally:
+            self.add(name, cat, start, self._now(), args)
+
+    def wrap(self, obj, cat):
+        """Return a proxy for `obj` that records a span for every
+        method call.  If a method returns a generator, the span
+        covers the whole iteration.
+        """
+        return _TracedProxy(self, obj, cat)
+
+    def write(self, path):
+        with self._lock:
+            events = list(self._events)
+        with open(path, 'w') as fp:
+            json.dump({'traceEvents': events,
+                       'displayTimeUnit': 'ms'}, fp)
+
+
+class _TracedProxy(object):
+
+    def __init__(self, tracer, obj, cat):
+        self._tracer = tracer
+        self._obj = obj
+        self._cat = cat
+
+    def _iterate(self, name, it):
+        start = self._tracer._now()
+        count = 0
+        try:
+            for item in it:
+                count += 1
+                yield item
+        finally:
+            self._tracer.add(name, self._cat, start, self._tracer._now(),
+                             {'items': count})
+
+    def _call(self, method, name, *args, **kwargs):
+        start = self._tracer._now()
+        try:
+            result = method(*args, **kwargs)
+        except BaseException:
+            self._tracer.add(name, self._cat, start, self._tracer._now())
+            raise
+        if isinstance(result, types.GeneratorType):
+            return self._iterate(name, result)
+        self._tracer.add(name, self._cat, start, self._tracer._now())
+        return result
+
+    def __getattr__(self, name):
+        attr = getattr(self._obj, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        return partial(self._call, attr, '{0}.{1}'.format(self._cat, name))
+
+
+class TraceAdapter(BaseAdapter):
+    """Transport adapter that records a span for every request, from
+    sending it until the response headers have arrived, and one for
+    reading the response body.  The body of a streamed response is
+    recorded while the caller reads it.
+    """
+
+    def __init__(self, adapter, tracer):
+        super(TraceAdapter, self).__init__()
+        self.adapter = adapter
+        self.tracer = tracer
+
+    def send(self, request, stream=False, **kwargs):
+        body = request.body
+        with self.tracer.span('request', 'http', method=request.method,
+                              url=request.url) as args:
+            if isinstance(body, str):
+                args['request_bytes'] = len(body)
+            response = self.adapter.send(request, stream=stream, **kwargs)
+            args['status'] = response.status_code
+        if stream:
+            return wrap_content(response, partial(self._body, request.url))
+        with self.tracer.span('body', 'http', url=request.url) as args:
+            args['response_bytes'] = len(response.content)
+        return response
+
+    def _body(self, url, chunks):
+        with self.tracer.span('body', 'http', url=url) as args:
+            args['response_bytes'] = 0
+            for chunk in chunks:
+                args['response_bytes'] += len(chunk)
+                yield chunk
+
+    def close(self):
+        self.adapter.close()
+
+
+def trace_connections(pool, tracer):
+    """Record a span for every new connection that `pool` (an
+    urllib3 connection pool) establishes.
+    """
+    if getattr(pool, '_gilliam_traced', False):
+        return
+    new_conn = pool._new_conn
+
+    def _new_conn():
+        conn = new_conn()
+        connect = conn.connect
+
+        def _connect():
+            with tracer.span('connect', 'http',
+                             host='{0}:{1}'.format(conn.host, conn.port)):
+                return connect()
+        conn.connect = _connect
+        return conn
+
+    pool._new_conn = _new_conn
+    pool._gilliam_traced = True
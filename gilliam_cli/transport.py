@@ -0,0 +1,94 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""HTTP transport tuned from the stage configuration."""
+
+import zlib
+
+from requests.adapters import HTTPAdapter
+
+from .trace import trace_connections
+
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    # requests older than 2.4 only accepts a number of retries.
+    Retry = None
+
+
+# Methods whose request bodies may be compressed.
+_COMPRESS_METHODS = ('POST', 'PUT', 'PATCH')
+
+
+def make_retry(retries, backoff):
+    """Return a retry policy that retries idempotent requests up to
+    `retries` times, sleeping `backoff * 2 ** (n - 1)` seconds between
+    attempts.
+    """
+    if Retry is None:
+        return retries
+    return Retry(total=retries, backoff_factor=backoff,
+                 status_forcelist=(502, 503, 504))
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class TunedHTTPAdapter(HTTPAdapter):
+    """HTTP adapter with default timeouts and compression of large
+    request bodies.
+
+    :param timeout: Default timeout for requests that do not specify
+        one; either a number or a `(connect, read)` tuple.
+
+    :param compress_min_size: Request bodies of at least this many
+        bytes are sent gzip-compressed.  `None` disables compression.
+
+    :param tracer: (Optional) A `Tracer` that new connections are
+        recorded to.
+    """
+
+    def __init__(self, timeout=None, compress_min_size=None, tracer=None,
+                 **kwargs):
+        self.timeout = timeout
+        self.compress_min_size = compress_min_size
+        self.tracer = tracer
+        super(TunedHTTPAdapter, self).__init__(**kwargs)
+
+    def get_connection(self, url, proxies=None):
+        pool = super(TunedHTTPAdapter, self).get_connection(url, proxies)
+        if self.tracer is not None:
+            trace_connections(pool, self.tracer)
+        return pool
+
+    def _compress(self, request):
+        body = request.body
+        if (self.compress_min_size is None
+                or request.method not in _COMPRESS_METHODS
+                or not isinstance(body, str)
+                or len(body) < self.compress_min_size
+                or 'Content-Encoding' in request.headers):
+            return
+        request.body = _gzip(body)
+        request.headers['Content-Encoding'] = 'gzip'
+        request.headers['Content-Length'] = str(len(request.body))
+
+    def send(self, request, timeout=None, **kwargs):
+        self._compress(request)
+        if timeout is None:
+            timeout = self.timeout
+        return super(TunedHTTPAdapter, self).send(
+            request, timeout=timeout, **kwargs)
@@ -13,7 +13,23 @@
 # limitations under the License.
 
 from urlparse import urljoin
+import errno
+import fcntl
+import json
+import logging
 import os
+import Queue
+import struct
+import sys
+import tempfile
+import termios
+import threading
+
+from .jsonstream import CollectionParser
+
+
+# Size of chunks read when parsing responses incrementally.
+_CHUNK_SIZE = 64 * 1024
 
 
 def parse_scale(scale):
@@ -49,10 +65,75 @@ def find_rootdir(fn='gilliam.yml'):
     return None
 
 
-def traverse_collection(httpclient, url):
-    """Traverse a collection, yielding every item."""
+def terminal_size(fd):
+    """Return the width and height of the terminal at `fd`."""
+    h, w, hp, wp = struct.unpack(
+        'HHHH',
+        fcntl.ioctl(fd, termios.TIOCGWINSZ,
+                    struct.pack('HHHH', 0, 0, 0, 0)))
+    return w, h
+
+
+def prefetch(iterable, depth=1):
+    """Consume `iterable` in a background thread, staying at most
+    `depth` items ahead of the caller.  Errors raised by the iterable
+    are re-raised in the caller.  If the caller stops iterating early
+    (or the generator is closed), the background thread stops after
+    the item it is currently producing.
+
+    If `depth` is zero, `iterable` is returned as is.
+    """
+    if not depth:
+        return iterable
+    return _prefetch(iterable, depth)
+
+
+def _prefetch(iterable, depth):
+    queue = Queue.Queue(depth)
+    stop = threading.Event()
+
+    def _put(entry):
+        while not stop.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+            except Queue.Full:
+                continue
+            return True
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((True, item)):
+                    return
+        except BaseException:
+            _put((False, sys.exc_info()))
+        else:
+            _put((None, None))
+
+    t = threading.Thread(target=_produce)
+    t.daemon = True
+    t.start()
+
+    try:
+        while True:
+            try:
+                ok, value = queue.get(timeout=0.5)
+            except Queue.Empty:
+                continue
+            if ok is None:
+                break
+            elif not ok:
+                raise value[0], value[1], value[2]
+            yield value
+    finally:
+        stop.set()
+
+
+def _traverse_pages(httpclient, url):
     while True:
         response = httpclient.get(url)
+        response.raise_for_status()
         collection = response.json()
         for item in collection['items']:
             yield item
@@ -61,7 +142,87 @@ def traverse_collection(httpclient, url):
         url = urljoin(url, collection['links']['next'])
 
 
+def _traverse_incremental(httpclient, url):
+    while True:
+        response = httpclient.get(url, stream=True)
+        response.raise_for_status()
+        parser = CollectionParser(response.iter_content(_CHUNK_SIZE))
+        for item in parser.items():
+            yield item
+        links = parser.document.get('links', {})
+        if not 'next' in links:
+            break
+        url = urljoin(url, links['next'])
+
+
+def traverse_collection(httpclient, url, incremental=False):
+    """Traverse a collection, yielding every item.
+
+    :param incremental: (Optional) If true, parse each page while it
+        is being downloaded and yield items as they arrive, instead of
+        loading the whole page first.  Memory use is then independent
+        of the page size.
+    """
+    items = (_traverse_incremental(httpclient, url) if incremental
+             else _traverse_pages(httpclient, url))
+    for item in items:
+        yield item
+
+
+def wrap_content(response, wrapper):
+    """Pass the body of a streamed `response` through `wrapper`, a
+    function from an iterator of chunks to an iterator of chunks, when
+    it is read with `iter_content` (which `content` and `iter_lines`
+    use as well).
+    """
+    iter_content = response.iter_content
+
+    def _iter_content(*args, **kwargs):
+        return wrapper(iter_content(*args, **kwargs))
+
+    response.iter_content = _iter_content
+    return response
+
+
 def last(it, default=None):
     for default in it:
         pass
     return default
+
+
+class JSONFile(object):
+    """A JSON document on disk that is replaced atomically."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        """Read the document.  A missing or corrupt file reads as an
+        empty document.
+        """
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                self.log.debug("cannot read {0}: {1}".format(self.path, err))
+        except ValueError:
+            pass
+        return {}
+
+    def save(self, data):
+        try:
+            try:
+                os.makedirs(os.path.dirname(self.path))
+            except EnvironmentError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path),
+                                       prefix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(data, fp)
+            os.rename(tmp, self.path)
+        except EnvironmentError as err:
+            self.log.debug("cannot write {0}: {1}".format(self.path, err))
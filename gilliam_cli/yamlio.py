@@ -0,0 +1,100 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reading and writing YAML.
+
+Documents are always loaded with the safe loader, so that a manifest
+or release fetched from elsewhere cannot construct arbitrary Python
+objects.  The loader and dumper that are written in C (on top of
+libyaml) are used when PyYAML was built with them.
+
+Files that are read by most commands, such as the stage configuration
+and the project manifest, are read with `load_file`.  It keeps the
+parsed document in a binary cache in `~/.gilliam/cache/yaml`, keyed
+by the path and modification time of the file, so that an unchanged
+file is not parsed again.
+"""
+
+import cPickle
+import hashlib
+import logging
+import os
+import tempfile
+
+
+_CACHE_DIR = os.path.expanduser('~/.gilliam/cache/yaml')
+
+log = logging.getLogger(__name__)
+
+
+def _yaml():
+    # imported when needed; a cache hit does not need yaml at all.
+    import yaml
+    return yaml
+
+
+def load(stream):
+    """Parse the YAML document in `stream` (a string or a file)."""
+    yaml = _yaml()
+    return yaml.load(stream, Loader=getattr(
+        yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def dump(data, stream=None, **kwargs):
+    """Write `data` as YAML to `stream`.  If `stream` is `None`, the
+    document is returned as a string.
+    """
+    yaml = _yaml()
+    return yaml.dump(data, stream, Dumper=getattr(
+        yaml, 'CSafeDumper', yaml.SafeDumper), **kwargs)
+
+
+def _store(path, entry):
+    try:
+        try:
+            os.makedirs(os.path.dirname(path), 0700)
+        except EnvironmentError:
+            pass
+        # mkstemp creates the file readable by the user only, which
+        # matters since the auth config holds passwords.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp')
+        with os.fdopen(fd, 'wb') as fp:
+            cPickle.dump(entry, fp, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except EnvironmentError as err:
+        log.debug("cannot write {0}: {1}".format(path, err))
+
+
+def load_file(path, cache_dir=_CACHE_DIR):
+    """Load the YAML document in the file at `path`.  The result of
+    an earlier parse is used if the file has not changed since.
+
+    :raises: IOError, OSError, yaml.YAMLError
+    """
+    st = os.stat(path)
+    key = (st.st_ino, st.st_size, st.st_mtime)
+    cache_path = os.path.join(
+        cache_dir, hashlib.md5(os.path.abspath(path)).hexdigest())
+    try:
+        with open(cache_path, 'rb') as fp:
+            cached_key, data = cPickle.load(fp)
+        if cached_key == key:
+            return data
+    except Exception:
+        # missing, unreadable, or written by an incompatible version.
+        pass
+    with open(path) as fp:
+        data = load(fp)
+    _store(cache_path, (key, data))
+    return data
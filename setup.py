@@ -41,12 +41,18 @@ setup(
             'deploy = gilliam_cli.commands.deploy:Deploy',
             'route = gilliam_cli.commands.route:Route',
             'routes = gilliam_cli.commands.route:Routes',
+            'apply routes = gilliam_cli.commands.route:ApplyRoutes',
+            'test route = gilliam_cli.commands.route:TestRoute',
+            'check routes = gilliam_cli.commands.route:CheckRoutes',
             'env = gilliam_cli.commands.env:Show',
             'set = gilliam_cli.commands.env:Set',
             'unset = gilliam_cli.commands.env:Unset',
+            'import env = gilliam_cli.commands.env:Import',
+            'export env = gilliam_cli.commands.env:Export',
             'releases = gilliam_cli.commands.releases:Releases',
             'auth = gilliam_cli.commands.auth:Auth',
             'dump release = gilliam_cli.commands.releases:DumpRelease',
+            'agent = gilliam_cli.commands.agent:Agent',
             ],
         'gilliam.services': [
             'etcd = gilliam_cli.services.etcd:EtcdService',
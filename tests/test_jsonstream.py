@@ -0,0 +1,68 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from gilliam_cli.jsonstream import CollectionParser
+
+
+DOCUMENT = json.dumps({
+    'items': [-23500.0, 1, 0, -0.5, 1e-07, 2.5E+30, 12, True, None,
+              'x', {'n': -1.25e3, 'list': [3.0, -4]}, [7e2]],
+    'links': {'next': '/page/2'},
+    })
+
+
+class CollectionParserTest(unittest.TestCase):
+
+    def _parse(self, chunks):
+        parser = CollectionParser(chunks)
+        items = list(parser.items())
+        return items, parser.document
+
+    def test_split_at_every_boundary(self):
+        expected = json.loads(DOCUMENT)
+        for n in range(len(DOCUMENT) + 1):
+            items, document = self._parse([DOCUMENT[:n], DOCUMENT[n:]])
+            self.assertEqual(items, expected['items'], n)
+            self.assertEqual(document['links'], expected['links'], n)
+
+    def test_one_byte_chunks(self):
+        items, _ = self._parse(list(DOCUMENT))
+        self.assertEqual(items, json.loads(DOCUMENT)['items'])
+
+    def test_number_split_after_point(self):
+        items, _ = self._parse(['{"items": [-23500.', '0, 1]}'])
+        self.assertEqual(items, [-23500.0, 1])
+
+    def test_empty_collection(self):
+        items, document = self._parse(['{"items": [], "links": {}}'])
+        self.assertEqual(items, [])
+        self.assertEqual(document, {'items': [], 'links': {}})
+
+    def test_malformed(self):
+        self.assertRaises(ValueError, self._parse, ['{"items": [1 2]}'])
+
+    def test_extra_data(self):
+        self.assertRaises(ValueError, self._parse, ['{"items": []} ', 'x'])
+
+    def test_reads_to_end(self):
+        chunks = iter(['{"items": [1]}', '  '])
+        list(CollectionParser(chunks).items())
+        self.assertEqual(list(chunks), [])
+
+
+if __name__ == '__main__':
+    unittest.main()